@@ -0,0 +1,42 @@
+'''
+Empty documents to benchmark and test against, made from the tables
+pxdlib reads.
+'''
+
+import sqlite3
+from pathlib import Path
+
+from pxdlib import make_blob
+
+SCHEMA = '''
+CREATE TABLE document_meta (key TEXT, value BLOB);
+CREATE TABLE document_info (key text, value BLOB);
+CREATE TABLE document_layers (
+  id INTEGER PRIMARY KEY, identifier TEXT, parent_identifier TEXT,
+  index_at_parent INTEGER, type INTEGER);
+CREATE TABLE layer_tiles (
+  layer_id INTEGER, identifier BLOB, timestamp BLOB,
+  format BLOB, size BLOB, metadata BLOB);
+CREATE TABLE layer_info (layer_id INTEGER, key TEXT, value BLOB);
+'''
+
+
+def make_document(folder, name='test.pxd', size=(64, 64), info=(), meta=()):
+    '''
+    Make a document with no layers in a folder, giving its path.
+
+    `info` and `meta` are `{key: value}` rows to add to `document_info`
+    and `document_meta`, besides the document's `size`.
+    '''
+    path = Path(folder) / name
+    (path / 'data').mkdir(parents=True)
+    db = sqlite3.connect(path / 'metadata.info')
+    db.executescript(SCHEMA)
+    info = dict(info, size=make_blob(b'BDSz', *size))
+    db.executemany(
+        'insert into document_info values (?, ?);', info.items())
+    db.executemany(
+        'insert into document_meta values (?, ?);', dict(meta).items())
+    db.commit()
+    db.close()
+    return path
@@ -0,0 +1,43 @@
+'''
+Benchmark of every blend mode, in megapixels per second.
+
+Blends random premultiplied images in place, as the renderer does.
+
+    python -m benchmarks.bench_blending [size]
+'''
+
+import sys
+from timeit import Timer
+
+import numpy as np
+
+from pxdlib import BlendMode
+from pxdlib.blending import blend
+
+
+def premultiplied(rng, size):
+    image = rng.random((size, size, 4), np.float32)
+    image[..., :3] *= image[..., 3:]
+    return image
+
+
+def main(size=1024):
+    rng = np.random.default_rng(0)
+    backdrop = premultiplied(rng, size)
+    source = premultiplied(rng, size)
+    out = backdrop.copy()
+    megapixels = size * size / 1e6
+
+    print(f'{size}x{size} images')
+    for mode in BlendMode:
+        # passThrough blends as normal does
+        if mode is BlendMode.passThrough:
+            continue
+        best = min(Timer(
+            lambda: blend(mode, backdrop, source, out=out)
+        ).repeat(repeat=3, number=1))
+        print(f'{mode.name:>14}: {megapixels / best:8.1f} MP/s')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,63 @@
+'''
+Benchmark of importing pxdlib, and a guard on what it imports.
+
+Times imports in fresh interpreters,
+then checks that modules only some features need (text, JSON, arrays,
+threads) are not imported just to open a document. Exits with an
+error if they are.
+
+    python -m benchmarks.bench_import [repeats]
+'''
+
+import subprocess
+import sys
+
+SCRIPTS = {
+    'import pxdlib': 'import pxdlib',
+    'pxdlib.PXDFile': 'import pxdlib; pxdlib.PXDFile',
+    'from pxdlib import *': 'from pxdlib import *',
+}
+
+# modules which must not be imported by `pxdlib.PXDFile`
+DEFERRED = (
+    'base64', 'plistlib', 'json', 'orjson', 'uuid', 'numpy',
+    'concurrent.futures', 'pxdlib.raster', 'pxdlib.render',
+)
+
+
+def import_time(script):
+    '''Seconds taken to run a script in a fresh interpreter.'''
+    timed = (
+        'from time import perf_counter; start = perf_counter()\n'
+        f'{script}\n'
+        'print(perf_counter() - start)'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', timed],
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout)
+
+
+def imported(script):
+    result = subprocess.run(
+        [sys.executable, '-c', f'{script}; import sys; print(*sys.modules)'],
+        capture_output=True, text=True, check=True,
+    )
+    return set(result.stdout.split())
+
+
+def main(repeats=5):
+    for label, script in SCRIPTS.items():
+        best = min(import_time(script) for _ in range(repeats))
+        print(f'{label:>22}: {best * 1000:6.1f} ms')
+
+    modules = imported(SCRIPTS['pxdlib.PXDFile'])
+    eager = [name for name in DEFERRED if name in modules]
+    if eager:
+        sys.exit(f'pxdlib.PXDFile imports {", ".join(eager)}')
+    print('pxdlib.PXDFile imports none of', ', '.join(DEFERRED))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
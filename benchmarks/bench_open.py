@@ -0,0 +1,42 @@
+'''
+Benchmark of opening a document, with its metadata read lazily
+and eagerly.
+
+Builds a temporary document whose metadata holds large values, as
+print info and XMP do, then times opening it and reading its size.
+
+    python -m benchmarks.bench_open [metadata size in KiB]
+'''
+
+import os
+import sys
+import tempfile
+from timeit import Timer
+
+from pxdlib import PXDFile
+
+from ._document import make_document
+
+
+def make_metadata_document(folder, size):
+    return make_document(
+        folder, 'bench.pxd', size=(1024, 768),
+        info={'print-info-data': os.urandom(size)},
+        meta={'metadata-data': os.urandom(size)},
+    )
+
+
+def main(kib=4096):
+    with tempfile.TemporaryDirectory() as folder:
+        path = make_metadata_document(folder, kib * 1024)
+        print(f'metadata of {2 * kib} KiB')
+        for eager in (False, True):
+            best = min(Timer(
+                lambda: PXDFile(path, eager=eager).size
+            ).repeat(5, 10)) / 10
+            label = 'eager' if eager else 'lazy'
+            print(f'{label:>6}: {best * 1000:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
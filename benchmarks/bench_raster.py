@@ -0,0 +1,75 @@
+'''
+Benchmark of reading raster layer pixels, serially and in parallel.
+
+Builds a temporary document with one large raster layer made of
+compressed tiles, then times `RasterLayer.to_array`.
+
+    python -m benchmarks.bench_raster [size] [tile size]
+'''
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import zlib
+from timeit import Timer
+
+import numpy as np
+
+from pxdlib import PXDFile, make_blob
+
+from ._document import make_document
+
+
+def make_raster_document(folder, size, tile):
+    path = make_document(folder, 'bench.pxd', size=(size, size))
+    db = sqlite3.connect(path / 'metadata.info')
+    ID = db.execute(
+        'insert into document_layers'
+        ' (identifier, parent_identifier, index_at_parent, type)'
+        " values ('LAYER', null, 0, 1);"
+    ).lastrowid
+    for key, value in (
+        ('name', make_blob(b'Strn', 'Raster')),
+        ('size', make_blob(b'PTSz', size, size)),
+    ):
+        db.execute('insert into layer_info values (?, ?, ?);', (ID, key, value))
+
+    # smooth noise compresses somewhat, like a photo would
+    rng = np.random.default_rng(0)
+    for ty in range(0, size, tile):
+        for tx in range(0, size, tile):
+            pixels = rng.integers(0, 16, (tile, tile, 4), np.uint8)
+            pixels = np.cumsum(pixels, axis=1, dtype=np.uint8)
+            name = f'{tx}-{ty}'
+            (path / 'data' / name).write_bytes(zlib.compress(pixels.tobytes()))
+            db.execute(
+                'insert into layer_tiles values (?, ?, ?, ?, ?, ?);', (
+                    ID, name, b'', 'RGBA8+zlib',
+                    make_blob(b'BDSz', tile, tile),
+                    json.dumps([1, {'origin': [tx, ty]}]),
+                ))
+    db.commit()
+    db.close()
+    return path
+
+
+def main(size=4096, tile=256):
+    with tempfile.TemporaryDirectory() as folder:
+        pxd = PXDFile(make_raster_document(folder, size, tile))
+        layer = pxd.find('Raster')
+        serial = layer.to_array()
+        assert (layer.to_array(workers=4) == serial).all()
+
+        print(f'{size}x{size} layer in {tile}x{tile} tiles')
+        for workers in (None, 2, 4, os.cpu_count()):
+            best = min(Timer(
+                lambda: layer.to_array(workers=workers)
+            ).repeat(repeat=3, number=1))
+            label = 'serial' if workers is None else f'{workers} threads'
+            print(f'{label:>12}: {best*1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
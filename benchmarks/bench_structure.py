@@ -0,0 +1,104 @@
+'''
+Micro-benchmark of the blob codec in `pxdlib.structure`.
+
+Compares decoding and encoding against a straightforward codec
+(as pxdlib 0.0.4 had) which validates and slices on every call.
+
+    python -m benchmarks.bench_structure
+'''
+
+from struct import Struct
+from timeit import Timer
+
+from pxdlib import structure
+from pxdlib.structure import blob, make_blob, memoize_blobs
+
+_LENGTH = Struct('<i')
+
+
+def _simple_bare(fmt, mul=None):
+    fmt = Struct(fmt)
+
+    def packer(*data):
+        if mul is not None:
+            data = [x / mul for x in data]
+        return fmt.pack(*data)
+
+    def unpacker(data):
+        result = fmt.unpack(data)
+        if mul is not None:
+            result = [x * mul for x in result]
+        if len(result) == 1:
+            result = result[0]
+        return result
+    return packer, unpacker
+
+
+def _simple_string_unpack(data):
+    length, = _LENGTH.unpack(data[:4])
+    return data[4:4+length].decode().replace('\x00', '')
+
+
+_SIMPLE = {
+    b'PTPt': _simple_bare('>dd', mul=2),
+    b'LOpc': _simple_bare('<H'),
+    b'UI64': _simple_bare('<Q'),
+    b'PTFl': _simple_bare('>d'),
+    b'Strn': (structure.string_pack, _simple_string_unpack),
+}
+
+
+def simple_blob(blob):
+    if not len(blob) > 12:
+        raise TypeError('Pixelmator blobs are more than 12 bytes! ')
+    if not blob[:4] == b'4-tP':
+        raise TypeError('Pixelmator blobs start with the magic number.')
+    kind = blob[4:8][::-1]
+    packer, unpacker = _SIMPLE[kind]
+    length, = _LENGTH.unpack(blob[8:12])
+    return unpacker(blob[12:12+length])
+
+
+def simple_make_blob(kind, *data):
+    packer, unpacker = _SIMPLE[kind]
+    data = packer(*data)
+    return b'4-tP' + kind[::-1] + _LENGTH.pack(len(data)) + data
+
+
+SAMPLES = [
+    (b'PTPt', (120.5, 64.0)),
+    (b'LOpc', (100, )),
+    (b'UI64', (0b1000001, )),
+    (b'PTFl', (0.0, )),
+    (b'Strn', ('Rectangle Layer', )),
+]
+
+
+def rate(stmt, n=200_000):
+    best = min(Timer(stmt).repeat(repeat=5, number=n))
+    return n / best
+
+
+def main():
+    print(f'{"":8} {"op":7} {"simple":>12} {"pxdlib":>12} {"memoized":>12}')
+    for kind, values in SAMPLES:
+        data = make_blob(kind, *values)
+        assert tuple(simple_blob(data)) == tuple(blob(data)) \
+            if kind == b'PTPt' else simple_blob(data) == blob(data)
+
+        memoize_blobs(0)
+        before = rate(lambda: simple_blob(data))
+        after = rate(lambda: blob(data))
+        memoize_blobs()
+        memo = rate(lambda: blob(data))
+        print(f'{kind.decode():8} {"decode":7} '
+              f'{before:12,.0f} {after:12,.0f} {memo:12,.0f}')
+
+        before = rate(lambda: simple_make_blob(kind, *values))
+        after = rate(lambda: make_blob(kind, *values))
+        print(f'{kind.decode():8} {"encode":7} {before:12,.0f} {after:12,.0f}')
+    print('(operations per second)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,6 @@
 import base64
 import binascii
 import datetime
-import json
 import os
 from pathlib import Path
 import sqlite3
@@ -9,7 +8,7 @@ import plistlib
 import struct
 
 import pxdlib as pxdlib
-from pxdlib import blob, verb, RGBA
+from pxdlib import blob, RGBA, VectorError
 
 def hexes(data):
     return binascii.hexlify(data).decode()
@@ -50,11 +49,11 @@ if __name__ == '__main__':
             print(string)
 
         elif isinstance(l, pxdlib.VectorLayer):
-            print()
-            data = verb(json.loads(l._info('shape-shapeData')))
-            data = {}
-            for k, v in data.items():
-                print('-', k, v)
+            try:
+                print(l.path)
+            except (VectorError, ImportError):
+                # shapes in an unknown layout, or NumPy missing
+                print()
         else:
             print()
         if l.mask:
@@ -3,9 +3,59 @@ __copyright__ = "Copyright 2020-2021 Mia yun Ruse"
 __status__ = "Alpha 0.0.4"
 __email__ = "mia@yunru.se"
 
-from .errors import *
-from .enums import *
-from .structure import *
-from .styles import *
-from .layer import *
-from .pxdfile import *
+# Names are imported from their submodules on first use,
+# so that `import pxdlib` itself is nearly free.
+
+from importlib import import_module as _import_module
+
+_EXPORTS = {
+    'errors': (
+        'PixelmatorError', 'VersionError', 'ChildError', 'MaskError',
+        'StyleError', 'RasterError', 'VectorError',
+    ),
+    'enums': (
+        'LayerFlag', 'BlendMode', 'LayerTag', 'FillType', 'GradientType',
+        'StrokeType', 'StrokePosition', 'PathVerb',
+    ),
+    'structure': (
+        'string_unpack', 'string_pack', 'BlobArray', 'array_unpack',
+        'array_pack', 'kind_unpack', 'kind_pack', 'memoize_blobs',
+        'blob', 'make_blob', 'decode_blobs', 'encode_blobs',
+        'decode_points', 'decode_sizes', 'decode_floats',
+        'encode_points', 'encode_sizes', 'encode_floats',
+        'verb', 'RGBA', 'Gradient',
+    ),
+    'styles': ('Style', 'Fill', 'Stroke', 'Shadow', 'InnerShadow'),
+    'layer': (
+        'Layer', 'GroupLayer', 'VectorLayer', 'RasterLayer', 'TextLayer',
+    ),
+    'pxdfile': ('PXDFile', 'guides'),
+    'frame': ('LayerFrame', ),
+}
+
+_SUBMODULES = {
+    'errors', 'enums', 'helpers', 'structure', 'styles', 'layer',
+    'pxdfile', 'index', 'raster', 'vector', 'blending', 'effects',
+    'render', 'frame',
+}
+
+_ORIGIN = {
+    name: module for module, names in _EXPORTS.items() for name in names
+}
+
+__all__ = list(_ORIGIN)
+
+
+def __getattr__(name):
+    if name in _ORIGIN:
+        value = getattr(_import_module(f'.{_ORIGIN[name]}', __name__), name)
+    elif name in _SUBMODULES:
+        value = _import_module(f'.{name}', __name__)
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | _SUBMODULES)
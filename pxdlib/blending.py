@@ -0,0 +1,213 @@
+'''
+Blend modes, as vectorised kernels over premultiplied float32 RGBA.
+
+Each `BlendMode` has a blend function B(cb, cs) of the (unpremultiplied)
+backdrop and source colours, which is composited as per the W3C
+Compositing and Blending specification:
+
+    colour = cs * as * (1 - ab) + cb * ab * (1 - as) + as * ab * B(cb, cs)
+    alpha = as + ab - as * ab
+'''
+
+from .enums import BlendMode
+from .helpers import require_numpy
+
+
+def _unpremultiply(np, image):
+    alpha = image[..., 3:]
+    return np.divide(
+        image[..., :3], alpha,
+        out=np.zeros_like(image[..., :3]), where=alpha > 0
+    )
+
+
+def _divide(np, a, b, fill):
+    return np.divide(a, b, out=np.full_like(a, fill), where=b != 0)
+
+
+# Separable blend functions, B(cb, cs), over colours from 0 to 1.
+
+def _multiply(np, cb, cs):
+    return cb * cs
+
+
+def _screen(np, cb, cs):
+    return cb + cs - cb * cs
+
+
+def _colorBurn(np, cb, cs):
+    burnt = 1 - np.minimum(1, _divide(np, 1 - cb, cs, 1))
+    burnt[cs == 0] = 0
+    burnt[cb == 1] = 1
+    return burnt
+
+
+def _colorDodge(np, cb, cs):
+    dodged = np.minimum(1, _divide(np, cb, 1 - cs, 1))
+    dodged[cs == 1] = 1
+    dodged[cb == 0] = 0
+    return dodged
+
+
+def _hardLight(np, cb, cs):
+    return np.where(
+        cs <= 0.5,
+        _multiply(np, cb, 2 * cs),
+        _screen(np, cb, 2 * cs - 1)
+    )
+
+
+def _softLight(np, cb, cs):
+    d = np.where(cb <= 0.25, ((16 * cb - 12) * cb + 4) * cb, np.sqrt(cb))
+    return np.where(
+        cs <= 0.5,
+        cb - (1 - 2 * cs) * cb * (1 - cb),
+        cb + (2 * cs - 1) * (d - cb)
+    )
+
+
+def _vividLight(np, cb, cs):
+    return np.where(
+        cs <= 0.5,
+        _colorBurn(np, cb, 2 * cs),
+        _colorDodge(np, cb, 2 * cs - 1)
+    )
+
+
+def _pinLight(np, cb, cs):
+    return np.where(
+        cs <= 0.5,
+        np.minimum(cb, 2 * cs),
+        np.maximum(cb, 2 * cs - 1)
+    )
+
+
+_SEPARABLE = {
+    BlendMode.darken: lambda np, cb, cs: np.minimum(cb, cs),
+    BlendMode.multiply: _multiply,
+    BlendMode.colorBurn: _colorBurn,
+    BlendMode.linearBurn: lambda np, cb, cs: np.maximum(cb + cs - 1, 0),
+    BlendMode.lighten: lambda np, cb, cs: np.maximum(cb, cs),
+    BlendMode.screen: _screen,
+    BlendMode.colorDodge: _colorDodge,
+    BlendMode.linearDodge: lambda np, cb, cs: np.minimum(cb + cs, 1),
+    BlendMode.overlay: lambda np, cb, cs: _hardLight(np, cs, cb),
+    BlendMode.softLight: _softLight,
+    BlendMode.hardLight: _hardLight,
+    BlendMode.vividLight: _vividLight,
+    BlendMode.linearLight:
+        lambda np, cb, cs: np.clip(cb + 2 * cs - 1, 0, 1),
+    BlendMode.pinLight: _pinLight,
+    BlendMode.hardMix:
+        lambda np, cb, cs: (cb + cs >= 1).astype(cb.dtype),
+    BlendMode.difference: lambda np, cb, cs: np.abs(cb - cs),
+    BlendMode.exclusion: lambda np, cb, cs: cb + cs - 2 * cb * cs,
+    BlendMode.subtract: lambda np, cb, cs: np.maximum(cb - cs, 0),
+    BlendMode.divide:
+        lambda np, cb, cs: np.minimum(1, _divide(np, cb, cs, 1)),
+}
+
+
+# Non-separable blend functions, over whole colours.
+
+def _lum(c):
+    return (
+        0.3 * c[..., 0:1] + 0.59 * c[..., 1:2] + 0.11 * c[..., 2:3]
+    )
+
+
+def _set_lum(np, c, lum):
+    c = c + (lum - _lum(c))
+    # clip the colour back into gamut, preserving luminosity
+    lum = _lum(c)
+    low = c.min(axis=-1, keepdims=True)
+    high = c.max(axis=-1, keepdims=True)
+    c = np.where(
+        low < 0, lum + _divide(np, (c - lum) * lum, lum - low, 0), c)
+    c = np.where(
+        high > 1, lum + _divide(np, (c - lum) * (1 - lum), high - lum, 0), c)
+    return c
+
+
+def _sat(c):
+    return c.max(axis=-1, keepdims=True) - c.min(axis=-1, keepdims=True)
+
+
+def _set_sat(np, c, sat):
+    low = c.min(axis=-1, keepdims=True)
+    return _divide(np, (c - low) * sat, _sat(c), 0)
+
+
+def _darkerColor(np, cb, cs):
+    return np.where(_lum(cs) < _lum(cb), cs, cb)
+
+
+def _lighterColor(np, cb, cs):
+    return np.where(_lum(cs) > _lum(cb), cs, cb)
+
+
+_NONSEPARABLE = {
+    BlendMode.darkerColor: _darkerColor,
+    BlendMode.lighterColor: _lighterColor,
+    BlendMode.hue: lambda np, cb, cs:
+        _set_lum(np, _set_sat(np, cs, _sat(cb)), _lum(cb)),
+    BlendMode.saturation: lambda np, cb, cs:
+        _set_lum(np, _set_sat(np, cb, _sat(cs)), _lum(cb)),
+    BlendMode.color: lambda np, cb, cs: _set_lum(np, cs, _lum(cb)),
+    BlendMode.luminosity: lambda np, cb, cs: _set_lum(np, cb, _lum(cs)),
+}
+
+_KERNELS = {**_SEPARABLE, **_NONSEPARABLE}
+
+
+def _blend_chunk(np, kernel, backdrop, source, out, clip):
+    sa = source[..., 3:]
+    ba = backdrop[..., 3:]
+    if kernel is None:
+        # source-over needs no unpremultiplying
+        if clip:
+            source = source * ba
+        np.multiply(backdrop, 1 - sa, out=out)
+        out += source
+        return
+
+    cb = _unpremultiply(np, backdrop)
+    cs = _unpremultiply(np, source)
+    mixed = kernel(np, cb, cs)
+    colour = backdrop[..., :3] * (1 - sa)
+    if not clip:
+        colour += source[..., :3] * (1 - ba)
+    colour += (sa * ba) * mixed
+    out[..., :3] = colour
+    out[..., 3:] = ba if clip else sa + ba - sa * ba
+
+
+def blend(mode, backdrop, source, out=None, chunk=1 << 14, clip=False):
+    '''
+    Blend `source` onto `backdrop` with a `BlendMode`.
+
+    Both are premultiplied float32 RGBA arrays of shape (height, width, 4).
+    The result is written to `out` (which may be `backdrop`, to blend in
+    place) or a new array, and returned. Pixels are processed `chunk`
+    at a time, so that temporary arrays stay small.
+
+    If `clip` is set, `source` is only drawn where `backdrop` is,
+    leaving its alpha unchanged.
+    '''
+    np = require_numpy()
+    mode = BlendMode(mode)
+    # pass-through only differs for groups, which are already isolated
+    kernel = _KERNELS.get(mode)
+
+    if backdrop.shape != source.shape:
+        raise ValueError('Backdrop and source must be the same shape.')
+    if out is None:
+        out = np.empty_like(backdrop)
+
+    height = backdrop.shape[0]
+    width = max(1, backdrop[0].size // 4) if height else 1
+    rows = max(1, chunk // width)
+    for i in range(0, height, rows):
+        j = slice(i, i + rows)
+        _blend_chunk(np, kernel, backdrop[j], source[j], out[j], clip)
+    return out
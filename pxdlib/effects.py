@@ -0,0 +1,262 @@
+'''
+Rendering layer styles, as premultiplied float32 RGBA.
+
+Styles are drawn from a layer's alpha: shadows from a Gaussian blur of
+it, and strokes from its distance transform. From the bottom up, a
+styled layer is drawn as its shadows, the layer itself, then its fills,
+inner shadows and strokes.
+
+Blurring is the slow part, so blurred alpha is remembered in
+`blur_cache`. It is looked up by the alpha itself (cropped to where it
+is not transparent), so moving a layer, or changing a shadow's colour,
+distance or angle, does not blur it again.
+'''
+
+from hashlib import blake2b
+from math import ceil, cos, sin
+
+from .blending import blend
+from .enums import BlendMode, FillType, StrokePosition
+from .helpers import require_numpy
+from .raster import TileCache
+from .styles import Fill, Stroke, Shadow, InnerShadow
+
+blur_cache = TileCache(64 * 2**20)
+
+
+def _sigma(style):
+    # the blur given is taken to be twice the standard deviation
+    return max(style.blur, 0) / 2
+
+
+def _radius(sigma):
+    return ceil(3 * sigma)
+
+
+def _offset(style):
+    # styles store their angle anticlockwise from east, and y is down
+    angle = style._dict['a']
+    return (
+        round(-style.distance * sin(angle)),
+        round(style.distance * cos(angle)),
+    )
+
+
+def _colour(np, style):
+    r, g, b, a = style.color
+    a = a / 255 * style.opacity
+    return np.array([r / 255 * a, g / 255 * a, b / 255 * a, a], np.float32)
+
+
+def blur(alpha, sigma, fill=0):
+    '''
+    Gaussian blur a 2D array with standard deviation `sigma`.
+
+    The result is larger by 3 sigma (rounded up) on every side, so that
+    nothing is cut off, with pixels beyond the array taken as `fill`.
+    The blur is done as a horizontal then vertical pass.
+    '''
+    np = require_numpy()
+    alpha = np.asarray(alpha, np.float32)
+    r = _radius(sigma)
+    if r == 0:
+        return alpha.copy()
+    x = np.arange(-r, r + 1, dtype=np.float32)
+    kernel = np.exp(-x * x / (2 * sigma * sigma))
+    kernel /= kernel.sum()
+
+    padded = np.pad(alpha, 2 * r, constant_values=fill)
+    h, w = alpha.shape[0] + 2 * r, alpha.shape[1] + 2 * r
+    rows = np.zeros((padded.shape[0], w), np.float32)
+    for i, weight in enumerate(kernel):
+        rows += weight * padded[:, i:i + w]
+    out = np.zeros((h, w), np.float32)
+    for i, weight in enumerate(kernel):
+        out += weight * rows[i:i + h]
+    return out
+
+
+def distance(mask, limit):
+    '''
+    The Euclidean distance from each pixel to the nearest true pixel
+    of a 2D boolean array.
+
+    Distances are exact up to `limit`, and further ones are given as
+    infinite. This takes `limit` vectorised steps down the columns,
+    then again along the rows, so is fast for small distances.
+    '''
+    np = require_numpy()
+    n = ceil(limit)
+    inf = np.float32(np.inf)
+    h, w = mask.shape
+
+    # squared distance to the nearest true pixel in the same column,
+    # then to the nearest of those along the row
+    squared = np.where(mask, np.float32(0), inf)
+    padded = np.pad(squared, ((n, n), (0, 0)), constant_values=inf)
+    for d in range(1, n + 1):
+        step = np.minimum(padded[n - d:n - d + h], padded[n + d:n + d + h])
+        np.minimum(squared, step + d * d, out=squared)
+
+    padded = np.pad(squared, ((0, 0), (n, n)), constant_values=inf)
+    for d in range(1, n + 1):
+        step = np.minimum(
+            padded[:, n - d:n - d + w], padded[:, n + d:n + d + w])
+        np.minimum(squared, step + d * d, out=squared)
+
+    dist = np.sqrt(squared)
+    dist[dist > limit] = inf
+    return dist
+
+
+def margin(styles) -> int:
+    '''How far, in pixels, the styles given may draw beyond a layer.'''
+    extent = 0
+    for style in styles:
+        if isinstance(style, Shadow):
+            dy, dx = _offset(style)
+            extent = max(
+                extent, max(abs(dy), abs(dx)) + _radius(_sigma(style)))
+        elif isinstance(style, Stroke):
+            if style.strokePosition != StrokePosition.inside:
+                extent = max(extent, ceil(style.strokeWidth) + 1)
+    return extent
+
+
+def _bounds(np, alpha, fill=0):
+    '''Where alpha is not `fill`, as (y0, y1, x0, x1), or None.'''
+    rows = np.flatnonzero((alpha != fill).any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero((alpha != fill).any(axis=0))
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+
+def _blurred(np, alpha, sigma, fill):
+    '''
+    The blurred alpha, and where its top-left falls, or None
+    if the alpha is entirely `fill`.
+    '''
+    bounds = _bounds(np, alpha, fill)
+    if bounds is None:
+        return None, None
+    y0, y1, x0, x1 = bounds
+    crop = np.ascontiguousarray(alpha[y0:y1, x0:x1])
+
+    key = (fill, sigma, crop.shape, blake2b(crop, digest_size=16).digest())
+    blurred = blur_cache.get(key)
+    if blurred is None:
+        blurred = blur(crop, sigma, fill)
+        blurred.flags.writeable = False
+        blur_cache.put(key, blurred)
+    r = _radius(sigma)
+    return blurred, (y0 - r, x0 - r)
+
+
+def _shifted(np, alpha, sigma, fill, offset):
+    '''The blurred alpha, moved by `offset`, over the same pixels.'''
+    out = np.full(alpha.shape, fill, np.float32)
+    blurred, corner = _blurred(np, alpha, sigma, fill)
+    if blurred is None:
+        return out
+    top, left = corner[0] + offset[0], corner[1] + offset[1]
+    h, w = blurred.shape
+    y0, x0 = max(top, 0), max(left, 0)
+    y1, x1 = min(top + h, out.shape[0]), min(left + w, out.shape[1])
+    if y0 < y1 and x0 < x1:
+        out[y0:y1, x0:x1] = blurred[y0 - top:y1 - top, x0 - left:x1 - left]
+    return out
+
+
+def _paint(np, style, shape, bounds):
+    '''The premultiplied colour or gradient a fill or stroke uses.'''
+    if style.fillType == FillType.color:
+        return np.broadcast_to(_colour(np, style), shape + (4, ))
+
+    # gradient positions are relative to the layer's bounds
+    y0, y1, x0, x1 = bounds
+    start, end = [
+        (x0 + x * (x1 - x0), y0 + y * (y1 - y0))
+        for x, y in style.gradientPosition
+    ]
+    paint = style.gradient.render(shape, start, end)
+    paint[..., :3] *= paint[..., 3:]
+    paint *= style.opacity
+    return paint
+
+
+def _stroke(np, alpha, style):
+    '''The coverage of a stroke, from 0 to 1.'''
+    width = style.strokeWidth
+    position = style.strokePosition
+    if position == StrokePosition.center:
+        inner = outer = width / 2
+    elif position == StrokePosition.inside:
+        inner, outer = width, 0
+    else:
+        inner, outer = 0, width
+
+    shape = alpha >= 0.5
+    coverage = np.zeros(alpha.shape, np.float32)
+    # a pixel a distance d from the other side lies d - 1 to d from the
+    # edge; the stroke is then anti-aliased by the layer's own alpha
+    if outer:
+        dist = distance(shape, outer + 1)
+        coverage += np.clip(outer + 1 - dist, 0, 1) * (1 - alpha)
+    if inner:
+        dist = distance(~shape, inner + 1)
+        coverage += np.clip(inner + 1 - dist, 0, 1) * alpha
+    return coverage
+
+
+def apply_styles(image, styles):
+    '''
+    Draw styles onto a layer's premultiplied float32 RGBA pixels.
+
+    The layer's fills, inner shadows and strokes are drawn onto `image`
+    in place. Shadows are returned, bottom-up, as a list of
+    `(pixels, BlendMode)` to be composited before the layer itself.
+    Disabled styles are not drawn.
+
+    `image` should have room around the layer for styles to draw into;
+    see `margin(styles)`.
+    '''
+    np = require_numpy()
+    alpha = np.ascontiguousarray(image[..., 3])
+    bounds = _bounds(np, alpha)
+    if bounds is None:
+        return []
+    shape = alpha.shape
+    shadows = []
+
+    for style in styles:
+        if not style.enabled:
+            continue
+        if isinstance(style, Shadow):
+            shadow = _shifted(np, alpha, _sigma(style), 0, _offset(style))
+            shadows.append((
+                shadow[..., None] * _colour(np, style), style.blendMode))
+
+    for kind in (Fill, InnerShadow, Stroke):
+        for style in styles:
+            if not (style.enabled and type(style) is kind):
+                continue
+            if kind is InnerShadow:
+                # the shadow cast inside by everything outside the layer
+                shadow = _shifted(
+                    np, 1 - alpha, _sigma(style), 1, _offset(style))
+                blend(
+                    BlendMode.normal, image,
+                    shadow[..., None] * _colour(np, style),
+                    out=image, clip=True)
+            elif kind is Fill:
+                paint = _paint(np, style, shape, bounds)
+                blend(style.blendMode, image, paint, out=image, clip=True)
+            else:
+                paint = _paint(np, style, shape, bounds)
+                coverage = _stroke(np, alpha, style)
+                blend(
+                    style.blendMode, image,
+                    coverage[..., None] * paint, out=image)
+
+    return shadows
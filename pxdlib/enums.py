@@ -83,3 +83,14 @@ class StrokePosition(enum.IntEnum):
     inside = 0
     center = 1
     outside = 2
+
+
+class PathVerb(enum.IntEnum):
+    '''
+    An element of a vector path, as in Core Graphics.
+    '''
+    moveTo = 0
+    lineTo = 1
+    quadTo = 2
+    curveTo = 3
+    close = 4
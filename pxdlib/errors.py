@@ -32,3 +32,17 @@ class StyleError(PixelmatorError):
     '''
     An invalid style was set.
     '''
+
+
+class RasterError(PixelmatorError):
+    '''
+    Raster data is missing, corrupt or in a layout
+    which pxdlib cannot yet read.
+    '''
+
+
+class VectorError(PixelmatorError):
+    '''
+    Vector shape data is missing, corrupt or in a layout
+    which pxdlib cannot yet read.
+    '''
@@ -0,0 +1,153 @@
+'''
+LayerFrame, a columnar view of every layer in a document.
+'''
+
+from io import UnsupportedOperation
+
+from .helpers import require_numpy
+from .layer import _LAYER_TYPES, _encode_opacity
+from .structure import blob, make_blob, decode_blobs, encode_blobs
+
+# column -> (layer_info key, blob kind, dtype, value when missing)
+_COLUMNS = {
+    'position': ('position', b'PTPt', 'f8', float('nan')),
+    'size': ('size', b'PTSz', 'f8', float('nan')),
+    'angle': ('angle', b'PTFl', 'f8', float('nan')),
+    # signed, so that negative opacities are caught rather than wrapped
+    'opacity': ('opacity', b'LOpc', 'i4', 0),
+    'flags': ('flags', b'UI64', 'u8', 0),
+}
+
+
+class LayerFrame:
+    '''
+    The attributes of every layer in a document, as NumPy columns
+    with one row per layer, in document order:
+
+    - `id`, `type` (the Layer subclass) and `parent` (the parent's id,
+      or -1 at the top level), which are read-only;
+    - `name`, an array of strings;
+    - `position` and `size`, (n, 2) arrays;
+    - `angle`, `opacity` and `flags` (see `LayerFlag`).
+
+    Columns may be modified in place, then written back with `commit()`,
+    which only writes the values that have changed, checked and
+    normalised as the Layer setters do. Values a layer does not have
+    are NaN (or 0), and are never written.
+    '''
+
+    def __init__(self, pxd):
+        np = require_numpy()
+        self.pxd = pxd
+        tree = pxd._tree
+        IDs = list(tree.walk())
+        row = {ID: i for i, ID in enumerate(IDs)}
+        n = len(IDs)
+
+        self.id = np.array(IDs, np.int64)
+        self.type = np.empty(n, object)
+        self.type[:] = [_LAYER_TYPES[tree.type[ID]] for ID in IDs]
+        self.parent = np.array([
+            tree.ids.get(tree.parent[ID], -1) for ID in IDs
+        ], np.int64)
+        for column in (self.id, self.type, self.parent):
+            column.flags.writeable = False
+
+        keys = ['name'] + [key for key, *_ in _COLUMNS.values()]
+        values = {key: ([], []) for key in keys}
+        for ID, key, value in pxd._db.execute(
+            'select layer_id, key, value from layer_info'
+            f' where key in ({", ".join("?" * len(keys))});',
+            keys
+        ):
+            if ID in row:
+                rows, data = values[key]
+                rows.append(row[ID])
+                data.append(value)
+
+        self._present = {}
+        rows, data = values['name']
+        self.name = np.full(n, None, object)
+        self.name[rows] = [blob(b) for b in data]
+        self._present['name'] = np.zeros(n, bool)
+        self._present['name'][rows] = True
+
+        for column, (key, kind, dtype, missing) in _COLUMNS.items():
+            rows, data = values[key]
+            shape = (n, 2) if kind in (b'PTPt', b'PTSz') else (n, )
+            array = np.full(shape, missing, dtype)
+            if rows:
+                array[rows] = decode_blobs(kind, data)
+            setattr(self, column, array)
+            self._present[column] = np.zeros(n, bool)
+            self._present[column][rows] = True
+
+        self._original = self._snapshot()
+
+    def __repr__(self):
+        return f'<LayerFrame of {self.pxd}: {len(self)} layers>'
+
+    def __len__(self):
+        return len(self.id)
+
+    @property
+    def layers(self) -> list:
+        '''The Layer of each row.'''
+        return [self.pxd._layer(int(ID)) for ID in self.id]
+
+    def _snapshot(self):
+        return {
+            column: getattr(self, column).copy()
+            for column in ('name', *_COLUMNS)
+        }
+
+    def _changed(self, column):
+        '''The rows whose value for a column has changed.'''
+        np = require_numpy()
+        new, old = getattr(self, column), self._original[column]
+        if new.shape != old.shape:
+            raise ValueError(f'The {column} column cannot be resized.')
+        changed = new != old
+        if new.dtype.kind == 'f':
+            changed &= ~(np.isnan(new) & np.isnan(old))
+        if changed.ndim > 1:
+            changed = changed.any(axis=1)
+        return np.flatnonzero(changed & self._present[column])
+
+    def commit(self) -> None:
+        '''
+        Write every changed value back to the document,
+        with one statement per attribute.
+        '''
+        pxd = self.pxd
+        if pxd.closed:
+            raise UnsupportedOperation('not writable')
+
+        rows = {}
+        changed = self._changed('name')
+        if changed.size:
+            rows['name'] = {
+                int(self.id[i]): make_blob(b'Strn', str(self.name[i]))
+                for i in changed
+            }
+            # as with layer.name, stop Pixelmator auto-naming
+            dynamic = make_blob(b'SI16', 0)
+            rows['text-nameIsDynamic'] = dict.fromkeys(rows['name'], dynamic)
+
+        changes = {column: self._changed(column) for column in _COLUMNS}
+        opacity = self.opacity[changes['opacity']]
+        invalid = opacity[(opacity < 0) | (opacity > 100)]
+        if invalid.size:
+            # raises, as setting layer.opacity would
+            _encode_opacity(int(invalid[0]))
+        # normalised as layer.angle is
+        self.angle[changes['angle']] %= 360
+
+        for column, (key, kind, *_) in _COLUMNS.items():
+            changed = changes[column]
+            if changed.size:
+                data = encode_blobs(kind, getattr(self, column)[changed])
+                rows[key] = dict(zip(self.id[changed].tolist(), data))
+
+        pxd._write_rows(rows)
+        self._original = self._snapshot()
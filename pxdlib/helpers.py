@@ -2,13 +2,52 @@
 Common functions used in pxdlib.
 '''
 
-from uuid import uuid1
+# The JSON library is only imported once JSON is first read or written.
+_json = None
+
+
+def _load_json():
+    global _json
+    try:
+        import orjson as _json
+    except ImportError:
+        import json as _json
+    return _json
 
 
 def uuid():
+    from uuid import uuid1
     return str(uuid1()).upper()
 
 
+def json_loads(data: bytes):
+    '''
+    Parse JSON, using orjson if it is installed.
+    '''
+    return (_json or _load_json()).loads(data)
+
+
+def json_dumps(obj) -> bytes:
+    '''
+    Serialise to UTF-8 encoded JSON, using orjson if it is installed.
+    '''
+    data = (_json or _load_json()).dumps(obj)
+    return data if isinstance(data, bytes) else data.encode()
+
+
+def require_numpy():
+    '''
+    Import NumPy, which is only needed for array features.
+    '''
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            'This feature requires NumPy: try `pip install pxdlib[numpy]`.'
+        ) from None
+    return numpy
+
+
 def num(number):
     '''
     Return float (or int, if an integer)
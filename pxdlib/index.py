@@ -0,0 +1,341 @@
+'''
+In-memory indices of a document's layers, so that
+finding and walking layers does not touch the database.
+'''
+
+from math import floor
+
+from .helpers import require_numpy
+from .structure import blob, decode_blobs
+
+
+class _LayerTree:
+    '''
+    In-memory snapshot of `document_layers`, built in a single scan.
+
+    Kept current by layer creation, deletion and reparenting,
+    so that walking the layer tree never touches the database.
+    '''
+
+    def __init__(self, db):
+        self.uuid = {}      # id -> identifier
+        self.type = {}      # id -> type code
+        self.parent = {}    # id -> parent identifier (None if top-level)
+        self.index = {}     # id -> index_at_parent
+        self.ids = {}       # identifier -> id
+        self.children = {}  # parent identifier -> [id...], in order
+        self.by_type = {}   # type code -> {id...}
+        self._positions = None
+
+        for ID, uuid, parent, index, typ in db.execute(
+            'select id, identifier, parent_identifier, index_at_parent, type'
+            ' from document_layers;'
+        ):
+            self.uuid[ID] = uuid
+            self.type[ID] = typ
+            self.parent[ID] = parent
+            self.index[ID] = index
+            self.ids[uuid] = ID
+            self.children.setdefault(parent, []).append(ID)
+            self.by_type.setdefault(typ, set()).add(ID)
+
+        for kids in self.children.values():
+            kids.sort(key=self._order)
+
+    def _order(self, ID):
+        # ties in index_at_parent fall back to storage order
+        return self.index[ID], ID
+
+    def _attach(self, ID, parent):
+        kids = self.children.setdefault(parent, [])
+        key = self._order(ID)
+        i = 0
+        while i < len(kids) and self._order(kids[i]) < key:
+            i += 1
+        kids.insert(i, ID)
+        self.parent[ID] = parent
+        self._positions = None
+
+    def _detach(self, ID):
+        parent = self.parent[ID]
+        kids = self.children[parent]
+        kids.remove(ID)
+        if not kids:
+            del self.children[parent]
+        self._positions = None
+
+    def add(self, ID, uuid, parent, index, typ):
+        self.uuid[ID] = uuid
+        self.type[ID] = typ
+        self.index[ID] = index
+        self.ids[uuid] = ID
+        self.by_type.setdefault(typ, set()).add(ID)
+        self._attach(ID, parent)
+
+    def remove(self, ID):
+        self._detach(ID)
+        del self.ids[self.uuid.pop(ID)]
+        self.by_type[self.type.pop(ID)].discard(ID)
+        del self.parent[ID]
+        del self.index[ID]
+
+    def move(self, ID, parent):
+        self._detach(ID)
+        self._attach(ID, parent)
+
+    def ancestors(self, ID):
+        '''Ids of the layers containing ID, nearest first.'''
+        path = []
+        ID = self.ids.get(self.parent[ID])
+        while ID is not None:
+            path.append(ID)
+            ID = self.ids.get(self.parent[ID])
+        return path
+
+    def walk(self, parent=None):
+        '''
+        Yield the ids below a parent identifier, depth-first,
+        with each layer before its children.
+        '''
+        stack = list(reversed(self.children.get(parent, ())))
+        while stack:
+            ID = stack.pop()
+            yield ID
+            stack.extend(reversed(self.children.get(self.uuid[ID], ())))
+
+    def positions(self):
+        '''{id: position} in document order.'''
+        if self._positions is None:
+            self._positions = {ID: i for i, ID in enumerate(self.walk())}
+        return self._positions
+
+
+class _LayerIndex:
+    '''
+    Lookup tables from layer attributes to layer ids,
+    built in a single scan of `layer_info`.
+
+    Kept current as attributes are written.
+    '''
+    KEYS = ('name', 'color-value', 'flags')
+
+    def __init__(self, db):
+        self.names = {}  # name -> {id...}
+        self.tags = {}   # tag -> {id...}
+        self.flags = {}  # id -> flags
+        self._name = {}  # id -> name
+        self._tag = {}   # id -> tag
+
+        for ID, key, value in db.execute(
+            'select layer_id, key, value from layer_info'
+            f' where key in ({", ".join("?" * len(self.KEYS))});',
+            self.KEYS
+        ):
+            self.update(ID, key, value)
+
+    @staticmethod
+    def _unfile(table, current, ID):
+        if ID in current:
+            old = current.pop(ID)
+            ids = table[old]
+            ids.discard(ID)
+            if not ids:
+                del table[old]
+
+    def _file(self, table, current, ID, value):
+        self._unfile(table, current, ID)
+        current[ID] = value
+        table.setdefault(value, set()).add(ID)
+
+    def update(self, ID, key, value):
+        if key == 'name':
+            self._file(self.names, self._name, ID, blob(value))
+        elif key == 'color-value':
+            self._file(self.tags, self._tag, ID, int(value))
+        elif key == 'flags':
+            self.flags[ID] = blob(value)
+
+    def remove(self, ID):
+        self._unfile(self.names, self._name, ID)
+        self._unfile(self.tags, self._tag, ID)
+        self.flags.pop(ID, None)
+
+    def matching(self, pattern):
+        '''Ids of layers whose whole name matches a regex.'''
+        if isinstance(pattern, str):
+            import re
+            pattern = re.compile(pattern)
+        ids = set()
+        for name, named in self.names.items():
+            if pattern.fullmatch(name):
+                ids |= named
+        return ids
+
+    def globbing(self, pattern):
+        '''Ids of layers whose name matches a glob pattern.'''
+        from fnmatch import translate
+        return self.matching(translate(pattern))
+
+
+def _bounds(np, geometry):
+    '''
+    Axis-aligned bounds (x0, y0, x1, y1) of rotated rectangles,
+    given as rows of (centre x, centre y, width, height, degrees).
+    '''
+    angle = np.radians(geometry[:, 4])
+    cos, sin = np.abs(np.cos(angle)), np.abs(np.sin(angle))
+    w, h = geometry[:, 2] / 2, geometry[:, 3] / 2
+    dx, dy = cos * w + sin * h, sin * w + cos * h
+    x, y = geometry[:, 0], geometry[:, 1]
+    return np.stack([x - dx, y - dy, x + dx, y + dy], axis=1)
+
+
+class _SpatialIndex:
+    '''
+    A grid of the bounding boxes of layers (in the coordinates of
+    `layer.position`, and allowing for rotation), built in a single
+    scan of `layer_info`.
+
+    Kept current as positions, sizes and angles are written.
+    '''
+    KEYS = ('position', 'size', 'angle')
+    # layers covering more cells than this are checked by every query
+    MAX_CELLS = 64
+
+    def __init__(self, db):
+        np = require_numpy()
+        self.geometry = {}  # id -> [x, y, width, height, angle]
+        self.bounds = {}    # id -> (x0, y0, x1, y1)
+        self.cells = {}     # (column, row) -> {id...}
+        self.large = set()  # ids of layers covering many cells
+        self._cells = {}    # id -> [(column, row)...]
+
+        found = {key: ([], []) for key in self.KEYS}
+        for ID, key, value in db.execute(
+            'select layer_id, key, value from layer_info'
+            f' where key in ({", ".join("?" * len(self.KEYS))});',
+            self.KEYS
+        ):
+            IDs, blobs = found[key]
+            IDs.append(ID)
+            blobs.append(value)
+
+        IDs = sorted(set(found['position'][0]) & set(found['size'][0]))
+        row = {ID: i for i, ID in enumerate(IDs)}
+        geometry = np.zeros((len(IDs), 5))
+        for key, columns, kind in (
+            ('position', slice(0, 2), b'PTPt'),
+            ('size', slice(2, 4), b'PTSz'),
+            ('angle', slice(4, 5), b'PTFl'),
+        ):
+            rows = [(i, row[ID]) for i, ID in enumerate(found[key][0])
+                    if ID in row]
+            if rows:
+                values = decode_blobs(kind, found[key][1])
+                values = values.reshape(len(values), -1)
+                take, put = zip(*rows)
+                geometry[list(put), columns] = values[list(take)]
+        bounds = _bounds(np, geometry)
+
+        # cells about the size of a typical layer
+        extent = np.maximum(bounds[:, 2] - bounds[:, 0],
+                            bounds[:, 3] - bounds[:, 1])
+        self.cell = float(np.median(extent)) if len(extent) else 1.0
+        self.cell = max(self.cell, 1.0)
+
+        for ID, values, box in zip(
+            IDs, geometry.tolist(), map(tuple, bounds.tolist())
+        ):
+            self.geometry[ID] = values
+            self._file(ID, box)
+        # layers missing a position or size are remembered in part,
+        # in case the rest is written later
+        for key, (IDs, blobs) in found.items():
+            for ID, value in zip(IDs, blobs):
+                if ID not in row:
+                    self.update(ID, key, value)
+
+    def _span(self, x0, y0, x1, y1):
+        c = self.cell
+        return (
+            range(floor(x0 / c), floor(x1 / c) + 1),
+            range(floor(y0 / c), floor(y1 / c) + 1),
+        )
+
+    def _file(self, ID, box):
+        self._unfile(ID)
+        self.bounds[ID] = box
+        columns, rows = self._span(*box)
+        if len(columns) * len(rows) > self.MAX_CELLS:
+            self.large.add(ID)
+            return
+        cells = [(i, j) for i in columns for j in rows]
+        self._cells[ID] = cells
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(ID)
+
+    def _unfile(self, ID):
+        self.bounds.pop(ID, None)
+        self.large.discard(ID)
+        for cell in self._cells.pop(ID, ()):
+            IDs = self.cells[cell]
+            IDs.discard(ID)
+            if not IDs:
+                del self.cells[cell]
+
+    def update(self, ID, key, value):
+        geometry = self.geometry.setdefault(ID, [None] * 4 + [0.0])
+        if key == 'position':
+            geometry[0:2] = blob(value)
+        elif key == 'size':
+            geometry[2:4] = blob(value)
+        elif key == 'angle':
+            geometry[4] = blob(value)
+        if None not in geometry:
+            np = require_numpy()
+            box = _bounds(np, np.array([geometry], float))[0]
+            self._file(ID, tuple(box.tolist()))
+
+    def remove(self, ID):
+        self._unfile(ID)
+        self.geometry.pop(ID, None)
+
+    def _candidates(self, x0, y0, x1, y1):
+        IDs = set(self.large)
+        columns, rows = self._span(x0, y0, x1, y1)
+        if len(columns) * len(rows) > len(self.cells):
+            for (i, j), found in self.cells.items():
+                if i in columns and j in rows:
+                    IDs |= found
+        else:
+            for i in columns:
+                for j in rows:
+                    IDs |= self.cells.get((i, j), set())
+        return IDs
+
+    def intersecting(self, x0, y0, x1, y1):
+        '''Ids of layers whose bounds meet a rectangle.'''
+        bounds = self.bounds
+        return {
+            ID for ID in self._candidates(x0, y0, x1, y1)
+            if bounds[ID][0] <= x1 and x0 <= bounds[ID][2]
+            and bounds[ID][1] <= y1 and y0 <= bounds[ID][3]
+        }
+
+    def containing(self, x, y):
+        '''Ids of layers which (allowing for rotation) contain a point.'''
+        IDs = list(self.intersecting(x, y, x, y))
+        if not IDs:
+            return set()
+        np = require_numpy()
+        geometry = np.array([self.geometry[ID] for ID in IDs], float)
+        # the point relative to each layer, unrotated
+        angle = np.radians(geometry[:, 4])
+        cos, sin = np.cos(angle), np.sin(angle)
+        dx, dy = x - geometry[:, 0], y - geometry[:, 1]
+        u, v = cos * dx + sin * dy, cos * dy - sin * dx
+        inside = (
+            (np.abs(u) <= geometry[:, 2] / 2)
+            & (np.abs(v) <= geometry[:, 3] / 2)
+        )
+        return {ID for ID, hit in zip(IDs, inside) if hit}
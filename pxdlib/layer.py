@@ -2,20 +2,77 @@
 Layer objects, bound to a PXD file.
 '''
 
-import json
-import plistlib
-import base64
 from io import UnsupportedOperation
 
-from .helpers import uuid
+from .helpers import uuid, json_loads, json_dumps
 from .structure import blob, make_blob, verb
 from .enums import LayerFlag, BlendMode, LayerTag
 from .styles import _STYLES
-from .errors import ChildError, MaskError, StyleError
+from .errors import ChildError, MaskError, StyleError, VectorError
+
+
+# Attribute encoders, shared by Layer's setters and `PXDFile.update_layers`.
+# Each takes a value as set on a layer, and gives the
+# layer_info key and data to write.
+
+def _encode_name(name):
+    return 'name', make_blob(b'Strn', name or 'Layer')
+
+
+def _encode_opacity(opacity):
+    if isinstance(opacity, int) and 0 <= opacity <= 100:
+        return 'opacity', make_blob(b'LOpc', opacity)
+    raise TypeError('Opacity must be an integer in range [0, 100].')
+
+
+def _encode_position(pos):
+    x, y = pos
+    return 'position', make_blob(b'PTPt', x, y)
+
+
+def _encode_size(size):
+    w, h = size
+    return 'size', make_blob(b'PTSz', w, h)
+
+
+def _encode_angle(angle):
+    return 'angle', make_blob(b'PTFl', angle % 360)
+
+
+def _encode_blendMode(blend):
+    if not isinstance(blend, BlendMode):
+        raise TypeError('Blend mode must be a BlendMode.')
+    return 'blendMode', make_blob(b'Blnd', blend.value)
+
+
+def _encode_tag(tag):
+    tag = tag or LayerTag.none
+    if not isinstance(tag, LayerTag):
+        raise TypeError('Tag must be a LayerTag.')
+    return 'color-value', int(tag)
+
+
+_ENCODERS = {
+    'name': _encode_name,
+    'opacity': _encode_opacity,
+    'position': _encode_position,
+    'size': _encode_size,
+    'angle': _encode_angle,
+    'blendMode': _encode_blendMode,
+    'tag': _encode_tag,
+}
+
+_FLAGS = {
+    'is_visible': LayerFlag.visible,
+    'is_locked': LayerFlag.locked,
+    'is_clipping': LayerFlag.clipping,
+}
 
 
 class Layer:
-    __slots__ = ('pxd', '_id')
+    # identity data is cached from the layer tree, and kept
+    # up to date by the methods that move or delete layers
+    __slots__ = ('pxd', '_id', '_uuid', '_parent', '_index')
 
     def __init__(self, parent, ID=None):
         if type(self) is Layer:
@@ -28,11 +85,24 @@ class Layer:
 
         if isinstance(ID, int):
             self._id = ID
+            self._load()
         else:
             self._create(parent)
 
+    def _load(self):
+        '''
+        internal: cache identity data from the layer tree.
+        '''
+        tree = self.pxd._tree
+        ID = self._id
+        self._uuid = tree.uuid[ID]
+        self._index = tree.index[ID]
+        parent = tree.parent[ID]
+        self._parent = None if parent is None else tree.ids[parent]
+
     def _create(self, parent):
         self._id = self._new_entry(parent, type(self))
+        self._load()
         self.pxd._layer_cache[self._id] = self
 
         self._assert(write=True)
@@ -80,6 +150,8 @@ class Layer:
 
         if pxd.closed:
             raise UnsupportedOperation('not writable')
+        # load the tree before inserting, or it would hold the row twice
+        tree = pxd._tree
 
         UUID = uuid()
         for code, kind in _LAYER_TYPES.items():
@@ -87,19 +159,14 @@ class Layer:
                 break
         else:
             raise TypeError('Unknown type copied')
-        return pxd._db.execute(
+        ID = pxd._db.execute(
             'insert into document_layers'
             ' (identifier, parent_identifier, index_at_parent, type)'
             ' values (?, ?, ?, ?)',
             (UUID, parent_UUID, index_at_parent, code)
         ).lastrowid
-        return id
-
-    @property
-    def _uuid(self):
-        return self.pxd._db.execute(
-            f"select identifier from document_layers where id = {self._id};"
-        ).fetchone()[0]
+        tree.add(ID, UUID, parent_UUID, index_at_parent, code)
+        return ID
 
     def _assert(self, write=False):
         if self._id is None:
@@ -110,15 +177,9 @@ class Layer:
     @property
     def parent(self):
         '''The parent, which may be a Layer or a PXDFile.'''
-        # construct {child: parent} and fetch
-        children = dict(self.pxd._db.execute(
-            'select child.id, parent.id from ('
-            '  document_layers child inner join document_layers parent'
-            '  on child.parent_identifier = parent.identifier);'
-        ).fetchall())
-        if self._id not in children:
+        if self._parent is None:
             return self.pxd
-        return self.pxd._layer(children[self._id])
+        return self.pxd._layer(self._parent)
 
     @parent.setter
     def parent(self, val):
@@ -146,6 +207,8 @@ class Layer:
                 'where id = ?;',
                 (uuid, self._id)
             )
+            self.pxd._tree.move(self._id, uuid)
+            self._parent = None if uuid is None else val._id
         else:
             # inter-PXD
             if val.pxd.closed:
@@ -154,9 +217,29 @@ class Layer:
             self.delete()
             self.pxd = new.pxd
             self._id = new._id
+            self._load()
             self.pxd._layer_cache[self._id] = self
             del new
 
+    @property
+    def ancestors(self) -> list:
+        '''
+        The layers containing this one, from its parent upwards.
+        '''
+        self._assert()
+        return [
+            self.pxd._layer(ID)
+            for ID in self.pxd._tree.ancestors(self._id)
+        ]
+
+    @property
+    def depth(self) -> int:
+        '''
+        How deeply the layer is nested; top-level layers are at 0.
+        '''
+        self._assert()
+        return len(self.pxd._tree.ancestors(self._id))
+
     @property
     def mask(self):
         '''
@@ -200,8 +283,8 @@ class Layer:
 
         ID = self._id
         self._id = None
+        self._uuid = self._parent = self._index = None
 
-        del self.pxd._layer_cache[ID]
         self.pxd._db.execute(
             f'delete from layer_info where layer_id = {ID};'
         )
@@ -211,9 +294,14 @@ class Layer:
         self.pxd._db.execute(
             f'delete from document_layers where id = {ID};'
         )
+        self.pxd._forget(ID)
 
     def _contains(self, child):
-        return child in self.pxd._layers(self, recurse=True)
+        return (
+            isinstance(child, Layer)
+            and child.pxd is self.pxd
+            and self._id in self.pxd._tree.ancestors(child._id)
+        )
 
     def copyto(self, parent, asmask=False):
         return self._copyto(parent, asmask, False)
@@ -236,10 +324,7 @@ class Layer:
 
         index_at_parent = 0
         if keep_index:
-            index_at_parent, = self.pxd._db.execute(
-                'select index_at_parent from document_layers'
-                f' where id = {self._id}'
-            ).fetchone()
+            index_at_parent = self._index
 
         ID = self._new_entry(parent, type(self), index_at_parent)
 
@@ -254,12 +339,13 @@ class Layer:
                 ' values (?, ?, ?)',
                 (ID, k, v)
             )
+            destpxd._cache_info(ID, k, v)
 
         layer = destpxd._layer(ID)
         if asmask:
             layer.is_mask = True
         for child in self.pxd._layers(self):
-            self._copyto(layer, asmask=False, keep_index=True)
+            child._copyto(layer, asmask=False, keep_index=True)
 
         return layer
 
@@ -281,7 +367,10 @@ class Layer:
 
     def _info(self, key, default=None):
         self._assert()
-        value = self.pxd._db.execute(
+        pxd = self.pxd
+        if pxd._prefetched(key):
+            return pxd._layer_info.get(self._id, {}).get(key, default)
+        value = pxd._db.execute(
             "select value from layer_info"
             f" where layer_id = ? and key = ?;",
             (self._id, key)
@@ -290,21 +379,37 @@ class Layer:
             return default
         return value[0]
 
+    def _parsed(self, key, parse):
+        '''
+        internal: get a layer_info value decoded by `parse(data)`,
+        remembered until the value is next written.
+
+        The value is shared, so must not be modified.
+        '''
+        cache = self.pxd._layer_parsed.setdefault(self._id, {})
+        if key not in cache:
+            data = self._info(key)
+            cache[key] = None if data is None else parse(data)
+        return cache[key]
+
     def _setinfo(self, key, data, create=False):
         self._assert(write=True)
         if create:
-            self.pxd._db.execute(
+            c = self.pxd._db.execute(
                 'insert into layer_info'
                 ' (layer_id, key, value)'
                 ' values (?, ?, ?);',
                 (self._id, key, data)
             )
         else:
-            self.pxd._db.execute(
+            c = self.pxd._db.execute(
                 'update layer_info set value = ?'
                 ' where layer_id = ? and key = ?',
                 (data, self._id, key)
             )
+        # only cache what actually made it into the document
+        if c.rowcount:
+            self.pxd._cache_info(self._id, key, data)
 
     # Attributes
 
@@ -317,8 +422,7 @@ class Layer:
 
     @name.setter
     def name(self, name: str):
-        name = name or "Layer"
-        self._setinfo('name', make_blob(b'Strn', name))
+        self._setinfo(*_encode_name(name))
         # Manually setting a name means Pixelmator no longer auto-sets name,
         # if a text layer
         DYNAMIC = 'text-nameIsDynamic'
@@ -334,10 +438,7 @@ class Layer:
 
     @opacity.setter
     def opacity(self, opacity):
-        if isinstance(opacity, int) and 0 <= opacity <= 100:
-            self._setinfo('opacity', make_blob(b'LOpc', opacity))
-        else:
-            raise TypeError('Opacity must be an integer in range [0, 100].')
+        self._setinfo(*_encode_opacity(opacity))
 
     @property
     def position(self) -> tuple:
@@ -349,8 +450,7 @@ class Layer:
 
     @position.setter
     def position(self, pos):
-        x, y = pos
-        self._setinfo('position', make_blob(b'PTPt', x, y))
+        self._setinfo(*_encode_position(pos))
 
     @property
     def size(self) -> int:
@@ -361,8 +461,7 @@ class Layer:
 
     @size.setter
     def size(self, size):
-        w, h = size
-        self._setinfo('size', make_blob(b'PTSz', w, h))
+        self._setinfo(*_encode_size(size))
 
     @property
     def angle(self) -> float:
@@ -375,7 +474,7 @@ class Layer:
 
     @angle.setter
     def angle(self, angle):
-        self._setinfo('angle', make_blob(b'PTFl', angle % 360))
+        self._setinfo(*_encode_angle(angle))
 
     @property
     def blendMode(self) -> BlendMode:
@@ -386,9 +485,7 @@ class Layer:
 
     @blendMode.setter
     def blendMode(self, blend):
-        if not isinstance(blend, BlendMode):
-            raise TypeError('Blend mode must be a BlendMode.')
-        self._setinfo('blendMode', make_blob(b'Blnd', str(blend)))
+        self._setinfo(*_encode_blendMode(blend))
 
     @property
     def tag(self) -> LayerTag:
@@ -399,10 +496,7 @@ class Layer:
 
     @tag.setter
     def tag(self, tag):
-        tag = tag or LayerTag.none
-        if not isinstance(tag, LayerTag):
-            raise TypeError('Tag must be a LayerTag.')
-        self._setinfo('color-value', int(tag))
+        self._setinfo(*_encode_tag(tag))
 
     # Flags
 
@@ -484,7 +578,7 @@ class Layer:
                 'Consider setting `layer.parent`.'
             )
 
-        self._flag_set(LayerFlag.mask, bool(val))
+        self._flag_set(LayerFlag.mask, bool(masked))
 
     @property
     def styles(self):
@@ -497,11 +591,9 @@ class Layer:
 
         would not have any effect.
         '''
-        data = self._info('styles-data')
+        data = self._parsed('styles-data', _parse_styles)
         if data is None:
             return []
-        data = verb(json.loads(data.decode()))
-        assert data['csr'] == 0
         styles = []
         for k in 'fsiS':
             kind = _STYLES[k]
@@ -515,13 +607,13 @@ class Layer:
         if isinstance(self, GroupLayer):
             raise StyleError('GroupLayers cannot have styles.')
         # attempt to extract csr, ctx
-        data = self._info('styles-data', None)
+        data = self._parsed('styles-data', _parse_styles)
         if data is None:
             create = True
             data = {}
         else:
             create = False
-            data = verb(json.loads(data.decode()))
+            data = dict(data)
         data['csr'] = 0
         for k in 'fsiS':
             data[k] = []
@@ -529,10 +621,16 @@ class Layer:
             k = style._tag
             style = style._to_layer()
             data[k].append([1, style])
-        data = json.dumps([1, data]).encode()
+        data = json_dumps([1, data])
         self._setinfo('styles-data', data, create=create)
 
 
+def _parse_styles(data):
+    data = verb(json_loads(data))
+    assert data['csr'] == 0
+    return data
+
+
 class GroupLayer(Layer):
     @property
     def children(self):
@@ -550,27 +648,116 @@ class GroupLayer(Layer):
 
 
 class VectorLayer(Layer):
-    pass
+    @property
+    def path(self):
+        '''
+        The layer's shape, as a `pxdlib.vector.Path` of NumPy arrays,
+        or None if it has no shape data.
+
+        The shape is decoded once, and remembered until next set.
+        It may be set to a transformed copy, eg to move it right:
+
+            layer.path = layer.path.transformed(translate=(10, 0))
+        '''
+        from . import vector
+        shape = self._parsed('shape-shapeData', vector.parse_shape)
+        return None if shape is None else shape.path
+
+    @path.setter
+    def path(self, path):
+        from . import vector
+        shape = self._parsed('shape-shapeData', vector.parse_shape)
+        if shape is None:
+            raise VectorError('Layer has no shape data to modify.')
+        self._setinfo('shape-shapeData', vector.encode_shape(shape, path))
 
 
 class RasterLayer(Layer):
-    pass
+    @classmethod
+    def from_array(
+        cls, parent, array, position=None, tile_size=256, workers=None,
+        pxdlib_only=False
+    ):
+        '''
+        Create a raster layer at the top of a parent, with pixels from
+        a (height, width, 4) NumPy array of RGBA bytes.
+
+        The layer is centred on `position`, or on the document by default.
+        Fully transparent tiles are not stored. Give `workers` as a
+        number of threads (or an `Executor`) to compress tiles in parallel.
+
+        Tiles are written in pxdlib's own layout (see `raster.py`), not
+        Pixelmator's, so layers made this way are only readable by
+        pxdlib: Pixelmator cannot display them. A `RasterError` is
+        raised unless `pxdlib_only=True` is given to accept this.
+        '''
+        from . import raster
+        raster._check_pxdlib_only(pxdlib_only)
+        array = raster.as_pixels(array)
+        pxd = parent.pxd if isinstance(parent, Layer) else parent
+        if position is None:
+            w, h = pxd.size
+            position = (w / 2, h / 2)
+
+        layer = cls(parent)
+        h, w = array.shape[:2]
+        layer._setinfo(*_encode_size((w, h)), create=True)
+        layer._setinfo(*_encode_position(position), create=True)
+        raster.write_tiles(layer, array, tile_size, workers, pxdlib_only)
+        return layer
+
+    def to_array(self, region=None, workers=None):
+        '''
+        The layer's pixels, as a (height, width, 4) NumPy array of RGBA bytes.
+
+        Give a region `(x, y, width, height)`, in pixels from the
+        top-left of the layer, to only read (and decode) that part.
+        Give `workers` as a number of threads (or an `Executor`)
+        to decode tiles in parallel.
+        '''
+        from . import raster
+        return raster.read_region(self, region, workers)
+
+    def tiles(self, region=None):
+        '''
+        Iterate over the layer's tiles as `(x, y, pixels)`,
+        where `pixels` is an array as given by `to_array`.
+
+        Give a region `(x, y, width, height)` to only read tiles
+        overlapping it.
+        '''
+        from . import raster
+        for tile, pixels in raster.iter_tiles(self, region):
+            yield tile.x, tile.y, pixels
 
 
 class TextLayer(Layer):
     @property
     def _text(self):
-        data = verb(json.loads(self._info('text-stringData')))
-        data = base64.b64decode(data['stringNSCodingData'])
-        return plistlib.loads(data)['$objects']
+        return self._parsed('text-stringData', _parse_text)
 
     def getText(self):
         '''
         Get (unformatted) text contents.
         '''
+        return _text_of(self._text)
+
+
+def _parse_text(data):
+    '''
+    Decode text-stringData into its archived objects.
+    '''
+    # only imported once text is read, as few scripts need them
+    import base64
+    import plistlib
+    data = verb(json_loads(data))
+    data = base64.b64decode(data['stringNSCodingData'])
+    return plistlib.loads(data)['$objects']
+
 
-        pText = self._text[1]['NSString']
-        return self._text[pText]['NS.string']
+def _text_of(objects):
+    pText = objects[1]['NSString']
+    return objects[pText]['NS.string']
 
 
 _LAYER_TYPES = {
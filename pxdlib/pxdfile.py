@@ -7,38 +7,128 @@ import sqlite3
 from io import UnsupportedOperation
 from collections import namedtuple
 
-from .layer import _LAYER_TYPES, Layer
+from .enums import LayerFlag
+from .layer import _LAYER_TYPES, _ENCODERS, _FLAGS, Layer
+from .layer import _parse_text, _text_of
 from .structure import blob, make_blob
+from .index import _LayerTree, _LayerIndex, _SpatialIndex
 
 guides = namedtuple('guides', ('horizontal', 'vertical'))
 
+# pragmas for read-only connections, which never write
+_READONLY_PRAGMAS = (
+    'PRAGMA query_only=ON',
+    'PRAGMA mmap_size=268435456',  # 256 MiB
+    'PRAGMA cache_size=-65536',  # 64 MiB
+)
+
+_MISSING = object()
+
+
+class _KeyValue:
+    '''
+    internal: a key-value table such as `document_info`,
+    each value read from the database the first time it is needed.
+    '''
+
+    def __init__(self, db, table):
+        self._db = db
+        self.table = table
+        self._values = {}
+        self._loaded = False
+
+    def load(self):
+        '''Read every value in a single query.'''
+        self._values.update(self._db.execute(
+            f'select key, value from {self.table};'))
+        self._loaded = True
+
+    def get(self, key, default=None):
+        value = self._values.get(key, _MISSING)
+        if value is _MISSING and not self._loaded:
+            row = self._db.execute(
+                f'select value from {self.table} where key = ?;', (key, )
+            ).fetchone()
+            # remember absent keys too, so they are only looked up once
+            value = self._values[key] = _MISSING if row is None else row[0]
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
 
 class PXDFile:
     def __repr__(self):
         return f"PXDFile({repr(str(self.path))})"
 
-    def __init__(self, path):
+    def __init__(self, path, eager=False, readonly=False, immutable=False):
         self.path = Path(path)
-        self._db = sqlite3.connect(self.path / 'metadata.info')
+        self.readonly = readonly or immutable
+        self._db = self._connect(immutable)
         self._closed = True
         self._layer_cache = {}
-
-        def keyval(table):
-            return dict(self._db.execute(
-                f"select key, value from {table};"
-            ).fetchall())
-        self._meta = keyval('document_meta')
-        self._info = keyval('document_info')
+        self._layer_tree = None
+        self._layer_index = None
+        self._layer_spatial = None
+        self._layer_info = {}
+        self._layer_parsed = {}
+        self._prefetch_keys = set()
+        self._prefetch_all = False
+
+        # document metadata is only read once asked for,
+        # unless `eager` is given
+        self._meta = _KeyValue(self._db, 'document_meta')
+        self._info = _KeyValue(self._db, 'document_info')
+        if eager:
+            self._meta.load()
+            self._info.load()
 
     # Layer management
 
+    @property
+    def _tree(self):
+        if self._layer_tree is None:
+            self._layer_tree = _LayerTree(self._db)
+        return self._layer_tree
+
+    @property
+    def _index(self):
+        if self._layer_index is None:
+            self._layer_index = _LayerIndex(self._db)
+        return self._layer_index
+
+    @property
+    def _spatial(self):
+        if self._layer_spatial is None:
+            self._layer_spatial = _SpatialIndex(self._db)
+        return self._layer_spatial
+
+    def _forget(self, ID):
+        '''
+        internal: drop a deleted layer from every in-memory index.
+        '''
+        self._layer_cache.pop(ID, None)
+        self._layer_info.pop(ID, None)
+        self._layer_parsed.pop(ID, None)
+        self._tree.remove(ID)
+        if self._layer_index is not None:
+            self._layer_index.remove(ID)
+        if self._layer_spatial is not None:
+            self._layer_spatial.remove(ID)
+
     def _layer(self, ID):
         if ID in self._layer_cache:
             return self._layer_cache[ID]
-        typ, = self._db.execute(
-            f"select type from document_layers where id = {ID};"
-        ).fetchone()
-        layer = _LAYER_TYPES[typ](self, ID)
+        layer = _LAYER_TYPES[self._tree.type[ID]](self, ID)
         self._layer_cache[ID] = layer
         return layer
 
@@ -49,28 +139,17 @@ class PXDFile:
         Specify recurse=True to get children recursively.
         Layers are always given in the user-visible order.
         '''
-        if parent is None:
-            cond = 'is null'
-        elif isinstance(parent, Layer):
-            cond = f' = "{parent._uuid}"'
-        elif isinstance(parent, str):
-            cond = f' = "{parent}"'
-        else:
+        if isinstance(parent, Layer):
+            parent = parent._uuid
+        elif not (parent is None or isinstance(parent, str)):
             raise TypeError('ID must be a layer, UUID or None.')
 
-        children = [self._layer(ID) for (ID, ) in self._db.execute(
-            "select id from document_layers"
-            f" where parent_identifier {cond}"
-            " order by index_at_parent asc;",
-        ).fetchall()]
+        tree = self._tree
         if recurse:
-            tree = []
-            for child in children:
-                tree.append(child)
-                tree += self._layers(child._uuid, recurse=True)
-            return tree
+            IDs = tree.walk(parent)
         else:
-            return children
+            IDs = tree.children.get(parent, ())
+        return [self._layer(ID) for ID in IDs]
 
     @property
     def children(self):
@@ -79,20 +158,304 @@ class PXDFile:
     def all_layers(self) -> list:
         return self._layers(recurse=True)
 
+    def prefetch(self, keys=None):
+        '''
+        Load layer attributes for every layer in a single query.
+
+        Reading a prefetched attribute never touches the database,
+        which makes scripts reading many layers much faster.
+        Give `keys` (eg `['name', 'position']`) to only load those
+        attributes; by default, everything is loaded.
+        '''
+        if keys is None:
+            rows = self._db.execute(
+                'select layer_id, key, value from layer_info;')
+        else:
+            keys = list(keys)
+            rows = self._db.execute(
+                'select layer_id, key, value from layer_info'
+                f' where key in ({", ".join("?" * len(keys))});',
+                keys
+            )
+        cache = self._layer_info
+        for ID, key, value in rows:
+            cache.setdefault(ID, {})[key] = value
+
+        if keys is None:
+            self._prefetch_all = True
+        else:
+            self._prefetch_keys.update(keys)
+
+    def _prefetched(self, key):
+        return self._prefetch_all or key in self._prefetch_keys
+
+    def _cache_info(self, ID, key, value):
+        parsed = self._layer_parsed.get(ID)
+        if parsed:
+            parsed.pop(key, None)
+        if self._prefetched(key):
+            self._layer_info.setdefault(ID, {})[key] = value
+        if self._layer_index is not None and key in _LayerIndex.KEYS:
+            self._layer_index.update(ID, key, value)
+        if self._layer_spatial is not None and key in _SpatialIndex.KEYS:
+            self._layer_spatial.update(ID, key, value)
+
     def find(self, name):
         '''Get the first layer found with the given name.'''
-        for l in self.all_layers():
-            if l.name == name:
-                return l
+        IDs = self._index.names.get(name)
+        if IDs:
+            positions = self._tree.positions()
+            IDs = [ID for ID in IDs if ID in positions]
+            if IDs:
+                return self._layer(min(IDs, key=positions.__getitem__))
+
+    def query(
+        self, name=None, *, glob=None, regex=None, type=None, tag=None,
+        visible=None, locked=None, clipping=None, mask=None
+    ) -> list:
+        '''
+        Get all layers matching every criterion given, in document order.
+
+        Layers may be matched by exact `name`, by a `glob` pattern
+        (eg `'Label *'`) or `regex` matching the whole name,
+        by `type` (eg `RasterLayer`), by `LayerTag`,
+        or by whether they are visible, locked, clipping or masks.
+        '''
+        index = self._index
+        tree = self._tree
+        IDs = None
+
+        def narrow(found):
+            nonlocal IDs
+            IDs = set(found) if IDs is None else IDs & found
+
+        if name is not None:
+            narrow(index.names.get(name, set()))
+        if glob is not None:
+            narrow(index.globbing(glob))
+        if regex is not None:
+            narrow(index.matching(regex))
+        if type is not None:
+            narrow(set().union(*(
+                tree.by_type.get(code, set())
+                for code, kind in _LAYER_TYPES.items()
+                if issubclass(kind, type)
+            )))
+        if tag is not None:
+            narrow(index.tags.get(int(tag), set()))
+
+        positions = tree.positions()
+        if IDs is None:
+            IDs = positions.keys()
+
+        flags = index.flags
+        for flag, want in (
+            (LayerFlag.visible, visible),
+            (LayerFlag.locked, locked),
+            (LayerFlag.clipping, clipping),
+            (LayerFlag.mask, mask),
+        ):
+            if want is not None:
+                IDs = [
+                    ID for ID in IDs
+                    if bool(flags.get(ID, 0) & flag) == bool(want)
+                ]
+
+        return self._in_order(IDs)
+
+    def _in_order(self, IDs):
+        '''internal: layers of the given ids, in document order.'''
+        positions = self._tree.positions()
+        IDs = sorted(
+            (ID for ID in IDs if ID in positions),
+            key=positions.__getitem__
+        )
+        return [self._layer(ID) for ID in IDs]
+
+    def layers_in(self, rect) -> list:
+        '''
+        Get every layer whose bounding box meets a rectangle
+        `(x, y, width, height)`, in document order.
+
+        Rectangles are in the same coordinates as `layer.position`.
+        Bounding boxes allow for `layer.angle`, and are kept in a grid
+        so that only nearby layers are checked.
+        '''
+        x, y, w, h = rect
+        return self._in_order(self._spatial.intersecting(x, y, x + w, y + h))
+
+    def layers_at(self, point) -> list:
+        '''
+        Get every layer containing a point `(x, y)`, in document order.
+
+        Points are in the same coordinates as `layer.position`,
+        and rotated layers are only hit within their rotated bounds.
+        '''
+        x, y = point
+        return self._in_order(self._spatial.containing(x, y))
+
+    def render(self, region=None, timings=None, workers=None):
+        '''
+        Render the document to a (height, width, 4) NumPy array
+        of RGBA bytes.
+
+        Give a region `(x, y, width, height)`, in pixels from the
+        top-left of the document, to only render (and read) that part.
+        Give a dictionary as `timings` to have it filled with the
+        seconds taken to render each layer (including its children).
+        `workers` is given to `RasterLayer.to_array` to read tiles.
+        '''
+        from .render import render
+        return render(self, region, timings, workers)
+
+    def frame(self):
+        '''
+        Get the attributes of every layer as a `LayerFrame` of NumPy
+        columns, read in a single query.
+
+        Columns can be changed in place and written back together
+        with `frame.commit()`, eg to move every layer right:
+
+            frame = pxd.frame()
+            frame.position[:, 0] += 100
+            with pxd:
+                frame.commit()
+        '''
+        from .frame import LayerFrame
+        return LayerFrame(self)
+
+    def texts(self, executor=None) -> dict:
+        '''
+        Get the (unformatted) text of every text layer, as `{layer: text}`.
+
+        All text is read in a single query. Decoding can be spread
+        across a `concurrent.futures` executor if one is given.
+        '''
+        tree = self._tree
+        rows = [
+            (ID, data) for ID, data in self._db.execute(
+                'select layer_id, value from layer_info'
+                " where key = 'text-stringData';"
+            ) if ID in tree.type
+        ]
+        data = [data for ID, data in rows]
+        if executor is None:
+            decoded = map(_parse_text, data)
+        else:
+            decoded = executor.map(_parse_text, data, chunksize=64)
+
+        texts = {}
+        for (ID, _), objects in zip(rows, decoded):
+            # remembered, so that layer.getText() is free afterwards
+            self._layer_parsed.setdefault(ID, {})['text-stringData'] = objects
+            texts[self._layer(ID)] = _text_of(objects)
+        return texts
+
+    def update_layers(self, changes: dict) -> None:
+        '''
+        Set attributes on many layers at once.
+
+        Takes a dictionary of `{layer: {attribute: value}}`, where
+        each layer may be given as a Layer or as a name (which will
+        change every layer with that name.) For example:
+
+            pxd.update_layers({'Label': {'position': (x, y), 'opacity': 50}})
+
+        This is much faster than setting attributes one layer at a time.
+        Supported attributes are `name`, `opacity`, `position`, `size`,
+        `angle`, `blendMode`, `tag`, `is_visible`, `is_locked`
+        and `is_clipping`.
+        '''
+        if self.closed:
+            raise UnsupportedOperation('not writable')
+
+        rows = {}  # key -> {id: data}
+        flags = {}  # id -> flags
+        for target, attributes in changes.items():
+            if isinstance(target, Layer):
+                if target.pxd is not self:
+                    raise ValueError(f'{target} is not in this document.')
+                target._assert(write=True)
+                IDs = [target._id]
+            else:
+                IDs = self._index.names.get(target)
+                if not IDs:
+                    raise KeyError(f'No layer named {target!r}.')
+
+            for attr, value in attributes.items():
+                if attr in _FLAGS:
+                    flag = _FLAGS[attr]
+                    for ID in IDs:
+                        val = flags.get(ID, self._index.flags.get(ID, 0))
+                        flags[ID] = val | flag if value else val & ~flag
+                elif attr in _ENCODERS:
+                    key, data = _ENCODERS[attr](value)
+                    for ID in IDs:
+                        rows.setdefault(key, {})[ID] = data
+                    if attr == 'name':
+                        # as with layer.name, stop Pixelmator auto-naming
+                        dynamic = make_blob(b'SI16', 0)
+                        for ID in IDs:
+                            rows.setdefault(
+                                'text-nameIsDynamic', {})[ID] = dynamic
+                else:
+                    raise AttributeError(
+                        f'Cannot update layer attribute {attr!r}.')
+
+        if flags:
+            rows['flags'] = {
+                ID: make_blob(b'UI64', val) for ID, val in flags.items()
+            }
+
+        self._write_rows(rows)
+
+    def _write_rows(self, rows):
+        '''
+        internal: write `{key: {id: data}}` to layer_info,
+        with one statement per key.
+        As with setting attributes, layers lacking a key are left be.
+        '''
+        for key, values in rows.items():
+            # layer_info has no index, so look rows up in one scan
+            # rather than scanning the table once per update.
+            rowids = dict(self._db.execute(
+                'select layer_id, rowid from layer_info where key = ?;',
+                (key, )
+            ))
+            values = {
+                ID: data for ID, data in values.items() if ID in rowids
+            }
+            self._db.executemany(
+                'update layer_info set value = ? where rowid = ?;',
+                [(data, rowids[ID]) for ID, data in values.items()]
+            )
+            for ID, data in values.items():
+                self._cache_info(ID, key, data)
 
     # Database management
 
+    def _connect(self, immutable=False):
+        path = self.path / 'metadata.info'
+        if not self.readonly:
+            return sqlite3.connect(path)
+        # Read-only connections take no write locks, and immutable ones
+        # take no locks at all, so that many readers never contend.
+        uri = path.resolve().as_uri() + '?mode=ro'
+        if immutable:
+            uri += '&immutable=1'
+        db = sqlite3.connect(uri, uri=True)
+        for pragma in _READONLY_PRAGMAS:
+            db.execute(pragma)
+        return db
+
     def open(self) -> None:
         '''
         Starts a transaction to modify the document.
 
         Changes will only be made on `close()`.
         '''
+        if self.readonly:
+            raise UnsupportedOperation('document is read-only')
         if not self._closed:
             return
         self._db.execute('PRAGMA journal_mode=DELETE')
@@ -125,13 +488,12 @@ class PXDFile:
     def _set(self, key, data, is_meta=False):
         if self.closed:
             raise UnsupportedOperation('not writable')
-        table = 'document_meta' if is_meta else 'document_info'
         store = self._meta if is_meta else self._info
 
         store[key] = data
         c = self._db.cursor()
         c.execute(
-            f'update {table} '
+            f'update {store.table} '
             'set value = ? where key = ?',
             (data, key)
         )
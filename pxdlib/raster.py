@@ -0,0 +1,335 @@
+'''
+Raster layer pixel data, held in `layer_tiles` and the `data` folder.
+
+Pixelmator's own tile layout is not yet reverse-engineered, so tiles
+are read in the following layout, with each `layer_tiles` row a tile:
+
+- `identifier` is the name of the tile's file in the `data` folder;
+- `format` is the tile's pixel format (see `_TILE_FORMATS`);
+- `size` is a `BDSz` blob of the tile's width and height in pixels;
+- `metadata` is a JSON verlist of `{"origin": [x, y]}`, the tile's
+  position in pixels from the top-left of the layer.
+
+Tiles in any other layout raise a `RasterError`.
+Pixels are given as (height, width, 4) arrays of RGBA bytes.
+'''
+
+import mmap
+import os
+import time
+import zlib
+from threading import Lock
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from .errors import RasterError
+from .helpers import json_loads, json_dumps, require_numpy, uuid
+from .structure import blob, make_blob, verb
+
+Tile = namedtuple('Tile', (
+    'identifier', 'timestamp', 'format', 'x', 'y', 'width', 'height'
+))
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _read_raw(np, data, tile):
+    count = tile.width * tile.height * 4
+    pixels = np.frombuffer(data, np.uint8, count)
+    return pixels.reshape(tile.height, tile.width, 4)
+
+
+def _read_zlib(np, data, tile):
+    return _read_raw(np, zlib.decompress(data), tile)
+
+
+_TILE_FORMATS = {
+    'RGBA8': _read_raw,
+    'RGBA8+zlib': _read_zlib,
+}
+
+
+def locate_tiles(layer) -> list:
+    '''
+    The tiles of a raster layer, without reading their pixels.
+    '''
+    layer._assert()
+    tiles = []
+    for identifier, timestamp, fmt, size, metadata in layer.pxd._db.execute(
+        'select identifier, timestamp, format, size, metadata'
+        ' from layer_tiles where layer_id = ?;',
+        (layer._id, )
+    ):
+        try:
+            width, height = blob(size)
+            x, y = verb(json_loads(metadata))['origin']
+        except (TypeError, ValueError, KeyError) as e:
+            raise RasterError(
+                f'Tiles of {layer} are in a layout pxdlib cannot read.'
+            ) from e
+        tiles.append(Tile(
+            _text(identifier), timestamp, _text(fmt),
+            int(x), int(y), int(width), int(height)
+        ))
+    return tiles
+
+
+class TileCache:
+    '''
+    A cache of decoded tiles, shared by every document in the process,
+    which keeps within a budget in bytes by evicting the least recently
+    used tiles.
+
+    Tiles are remembered by their `layer_tiles` timestamp, so a tile
+    is never served once it has been rewritten.
+    '''
+
+    def __init__(self, budget=256 * 2**20):
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._tiles = OrderedDict()
+        self._nbytes = 0
+        self._lock = Lock()
+
+    def __repr__(self):
+        return (
+            f'<TileCache {self._nbytes:,}/{self.budget:,} bytes:'
+            f' {self.hits} hits, {self.misses} misses,'
+            f' {self.evictions} evictions>'
+        )
+
+    def __len__(self):
+        return len(self._tiles)
+
+    @property
+    def nbytes(self) -> int:
+        '''The size of all tiles held, in bytes.'''
+        return self._nbytes
+
+    def get(self, key):
+        with self._lock:
+            pixels = self._tiles.get(key)
+            if pixels is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._tiles.move_to_end(key)
+            return pixels
+
+    def put(self, key, pixels):
+        size = pixels.nbytes
+        with self._lock:
+            if key in self._tiles or size > self.budget:
+                return
+            while self._nbytes + size > self.budget:
+                _, old = self._tiles.popitem(last=False)
+                self._nbytes -= old.nbytes
+                self.evictions += 1
+            self._tiles[key] = pixels
+            self._nbytes += size
+
+    def clear(self):
+        '''Forget every tile, and reset the counters.'''
+        with self._lock:
+            self._tiles.clear()
+            self._nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+tile_cache = TileCache()
+
+
+def _map(path):
+    # Memory-mapped, so that only the parts of a file used are read.
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return b''
+
+
+def read_tile(layer, tile):
+    '''
+    Decode a tile's pixels, as a read-only NumPy array.
+
+    Tiles are remembered in `tile_cache`, unless they lack a timestamp
+    (in which case they could not be known to be up to date.)
+    '''
+    np = require_numpy()
+    path = layer.pxd.path
+    key = None
+    if tile.timestamp:
+        key = (
+            os.path.abspath(path), layer._uuid,
+            tile.identifier, tile.timestamp
+        )
+        pixels = tile_cache.get(key)
+        if pixels is not None:
+            return pixels
+
+    if tile.format not in _TILE_FORMATS:
+        raise RasterError(f'Unknown tile format {tile.format!r}.')
+    try:
+        data = _map(path / 'data' / tile.identifier)
+        pixels = _TILE_FORMATS[tile.format](np, data, tile)
+    except (OSError, ValueError, zlib.error) as e:
+        raise RasterError(
+            f'Could not read tile {tile.identifier}.') from e
+
+    pixels.setflags(write=False)
+    if key is not None:
+        tile_cache.put(key, pixels)
+    return pixels
+
+
+def _overlap(tile, x, y, w, h):
+    x0, y0 = max(tile.x, x), max(tile.y, y)
+    x1 = min(tile.x + tile.width, x + w)
+    y1 = min(tile.y + tile.height, y + h)
+    if x0 < x1 and y0 < y1:
+        return x0, y0, x1, y1
+
+
+def _region(layer, region):
+    if region is None:
+        w, h = layer.size
+        return 0, 0, round(w), round(h)
+    x, y, w, h = region
+    return int(x), int(y), int(w), int(h)
+
+
+def iter_tiles(layer, region=None):
+    '''
+    Yield `(tile, pixels)` for each tile overlapping a region.
+    '''
+    x, y, w, h = _region(layer, region)
+    for tile in locate_tiles(layer):
+        if _overlap(tile, x, y, w, h):
+            yield tile, read_tile(layer, tile)
+
+
+def read_region(layer, region=None, workers=None):
+    '''
+    Assemble the pixels of a region of a layer from its tiles, as a
+    NumPy array, only decoding those tiles which overlap it.
+
+    Tiles are decoded one at a time, unless `workers` is given as a
+    number of threads or an `Executor` to decode them in parallel.
+    Each tile is written straight into the output.
+    '''
+    np = require_numpy()
+    x, y, w, h = _region(layer, region)
+    out = np.zeros((h, w, 4), np.uint8)
+    tiles = [t for t in locate_tiles(layer) if _overlap(t, x, y, w, h)]
+
+    def paste(tile):
+        # tiles never overlap, so threads never write to the same pixels
+        x0, y0, x1, y1 = _overlap(tile, x, y, w, h)
+        pixels = read_tile(layer, tile)
+        out[y0-y:y1-y, x0-x:x1-x] = pixels[
+            y0-tile.y:y1-tile.y, x0-tile.x:x1-tile.x]
+
+    if workers is None or len(tiles) < 2:
+        for tile in tiles:
+            paste(tile)
+    elif isinstance(workers, Executor):
+        # consume results, so that errors are raised
+        for _ in workers.map(paste, tiles):
+            pass
+    else:
+        with ThreadPoolExecutor(workers) as pool:
+            for _ in pool.map(paste, tiles):
+                pass
+    return out
+
+
+def as_pixels(array):
+    '''
+    Check an array is of RGB or RGBA bytes, giving it as a NumPy array
+    of RGBA.
+    '''
+    np = require_numpy()
+    array = np.asarray(array)
+    if not (
+        array.dtype == np.uint8
+        and array.ndim == 3
+        and array.shape[2] in (3, 4)
+    ):
+        raise ValueError(
+            'Pixels must be a (height, width, 4) array of RGBA bytes.')
+    if array.shape[2] == 3:
+        alpha = np.full(array.shape[:2] + (1, ), 255, np.uint8)
+        array = np.concatenate([array, alpha], axis=2)
+    return array
+
+
+def _check_pxdlib_only(pxdlib_only):
+    if not pxdlib_only:
+        raise RasterError(
+            "Tiles are written in pxdlib's own layout, which Pixelmator"
+            ' cannot display. Give pxdlib_only=True to write them anyway.')
+
+
+def write_tiles(
+    layer, array, tile_size=256, workers=None, pxdlib_only=False
+):
+    '''
+    Split an array of RGBA bytes into tiles, and write them to the
+    `data` folder and `layer_tiles`.
+
+    Fully transparent tiles are skipped. Tiles are compressed one at a
+    time, unless `workers` is given as a number of threads or an
+    `Executor` to compress them in parallel.
+
+    As the tiles are in the layout above, which Pixelmator cannot
+    display, this refuses to write them unless `pxdlib_only` is given.
+    '''
+    _check_pxdlib_only(pxdlib_only)
+    layer._assert(write=True)
+    array = as_pixels(array)
+    height, width = array.shape[:2]
+    folder = layer.pxd.path / 'data'
+    folder.mkdir(exist_ok=True)
+    timestamp = make_blob(b'PTFl', time.time())
+
+    origins = [
+        (x, y)
+        for y in range(0, height, tile_size)
+        for x in range(0, width, tile_size)
+    ]
+    # made up front, as uuid1 is not thread-safe
+    identifiers = [uuid() for _ in origins]
+
+    def encode(origin, identifier):
+        x, y = origin
+        pixels = array[y:y+tile_size, x:x+tile_size]
+        if not pixels[..., 3].any():
+            return None
+        h, w = pixels.shape[:2]
+        data = zlib.compress(pixels.tobytes())
+        (folder / identifier).write_bytes(data)
+        return (
+            layer._id, identifier, timestamp, 'RGBA8+zlib',
+            make_blob(b'BDSz', w, h),
+            json_dumps([1, {'origin': [x, y]}]),
+        )
+
+    if workers is None or len(origins) < 2:
+        rows = map(encode, origins, identifiers)
+    elif isinstance(workers, Executor):
+        rows = workers.map(encode, origins, identifiers)
+    else:
+        with ThreadPoolExecutor(workers) as pool:
+            rows = list(pool.map(encode, origins, identifiers))
+
+    layer.pxd._db.executemany(
+        'insert into layer_tiles'
+        ' (layer_id, identifier, timestamp, format, size, metadata)'
+        ' values (?, ?, ?, ?, ?, ?);',
+        [row for row in rows if row is not None]
+    )
@@ -0,0 +1,183 @@
+'''
+Rendering a document (or part of one) to pixels.
+
+Layers are composited as premultiplied float32 RGBA arrays, from the
+bottom of the document upwards, honouring visibility, opacity, masks,
+clipping, blend modes and styles. Only raster layers have pixels to
+draw; groups are composited in isolation, then onto the layers below.
+'''
+
+from time import perf_counter
+
+from . import effects
+from .blending import blend
+from .helpers import require_numpy
+from .layer import GroupLayer, RasterLayer
+
+
+def _premultiply(np, pixels):
+    image = pixels.astype(np.float32)
+    image *= 1 / 255
+    image[..., :3] *= image[..., 3:]
+    return image
+
+
+def _to_bytes(np, image):
+    alpha = image[..., 3:]
+    rgb = np.divide(
+        image[..., :3], alpha,
+        out=np.zeros_like(image[..., :3]), where=alpha > 0
+    )
+    out = np.empty(image.shape, np.uint8)
+    out[..., :3] = np.clip(rgb * 255 + 0.5, 0, 255)
+    out[..., 3:] = np.clip(alpha * 255 + 0.5, 0, 255)
+    return out
+
+
+class _Renderer:
+    def __init__(self, pxd, region, timings, workers):
+        self.np = require_numpy()
+        self.height = pxd.size[1]
+        self.x, self.y, self.w, self.h = region
+        self.timings = timings
+        self.workers = workers
+
+    def _place(self, layer, margin=0):
+        '''
+        The part of the region (widened by `margin` on every side)
+        a layer covers, as (x0, y0, x1, y1) relative to the layer's
+        top-left, or None if it is outside.
+        '''
+        px, py = layer.position
+        lw, lh = layer.size
+        lw, lh = round(lw), round(lh)
+        # layer positions are centres, with the origin at the bottom-left
+        left = round(px - lw / 2)
+        top = round(self.height - py - lh / 2)
+        x, y = self.x - margin, self.y - margin
+        x0, y0 = max(left, x), max(top, y)
+        x1 = min(left + lw, x + self.w + 2 * margin)
+        y1 = min(top + lh, y + self.h + 2 * margin)
+        if x0 < x1 and y0 < y1:
+            return left, top, x0, y0, x1, y1
+
+    def _read(self, layer, margin=0):
+        '''
+        A raster layer's pixels within the region, premultiplied,
+        and the slices of the (widened) region they occupy.
+        '''
+        placed = self._place(layer, margin)
+        if placed is None:
+            return None, None
+        left, top, x0, y0, x1, y1 = placed
+        pixels = layer.to_array(
+            (x0 - left, y0 - top, x1 - x0, y1 - y0), self.workers)
+        x, y = self.x - margin, self.y - margin
+        where = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+        return _premultiply(self.np, pixels), where
+
+    def _mask(self, layer, margin=0):
+        '''A layer's mask across the (widened) region, from 0 to 1.'''
+        np = self.np
+        mask = np.zeros(
+            (self.h + 2 * margin, self.w + 2 * margin), np.float32)
+        pixels, where = self._read(layer, margin)
+        if pixels is not None:
+            # premultiplied, so transparent mask pixels hide too
+            mask[where] = pixels[..., :3].mean(axis=2)
+        return mask
+
+    def layer(self, layer):
+        '''
+        Render a layer as a list of `(pixels, slices, blend mode)`,
+        to be composited in order onto the slices of the region given.
+        The last is the layer itself; any others are its shadows.
+        '''
+        np = self.np
+        styles, margin = [], 0
+        if isinstance(layer, GroupLayer):
+            image, where = self.group(layer.children), (slice(None), ) * 2
+        elif isinstance(layer, RasterLayer):
+            styles = [style for style in layer.styles if style.enabled]
+            margin = effects.margin(styles)
+            image, where = self._read(layer, margin)
+        else:
+            return []
+        if image is None:
+            return []
+
+        mask = layer.mask
+        if mask is not None and mask.is_visible:
+            image *= self._mask(mask, margin)[where][..., None]
+
+        passes = []
+        if styles:
+            canvas = np.zeros(
+                (self.h + 2 * margin, self.w + 2 * margin, 4), np.float32)
+            canvas[where] = image
+            shadows = effects.apply_styles(canvas, styles)
+            crop = (
+                slice(margin, margin + self.h),
+                slice(margin, margin + self.w),
+            )
+            where = (slice(None), ) * 2
+            passes = [(pixels[crop], where, mode) for pixels, mode in shadows]
+            image = canvas[crop]
+        passes.append((image, where, layer.blendMode))
+
+        opacity = layer.opacity
+        if opacity != 100:
+            for pixels, _, _ in passes:
+                pixels *= opacity / 100
+        return passes
+
+    def composite(self, backdrop, image, mode):
+        blend(mode, backdrop, image, out=backdrop)
+
+    def group(self, layers):
+        np = self.np
+        image = np.zeros((self.h, self.w, 4), np.float32)
+        base = None  # alpha of the layer that clipping layers clip to
+
+        for layer in reversed(layers):
+            start = perf_counter()
+            clipping = layer.is_clipping
+            if not layer.is_visible or (clipping and base is None):
+                if not clipping:
+                    base = None
+                continue
+
+            passes = self.layer(layer)
+            if not passes:
+                if not clipping:
+                    base = None
+                continue
+            if clipping:
+                for pixels, where, _ in passes:
+                    pixels *= base[where][..., None]
+            else:
+                pixels, where, _ = passes[-1]
+                base = np.zeros((self.h, self.w), np.float32)
+                base[where] = pixels[..., 3]
+
+            for pixels, where, mode in passes:
+                self.composite(image[where], pixels, mode)
+            if self.timings is not None:
+                self.timings[layer] = perf_counter() - start
+        return image
+
+
+def render(pxd, region=None, timings=None, workers=None):
+    '''
+    Render a document to a (height, width, 4) array of RGBA bytes.
+
+    See `PXDFile.render`.
+    '''
+    np = require_numpy()
+    if region is None:
+        w, h = pxd.size
+        region = (0, 0, w, h)
+    region = tuple(int(i) for i in region)
+
+    renderer = _Renderer(pxd, region, timings, workers)
+    return _to_bytes(np, renderer.group(pxd.children))
@@ -3,9 +3,12 @@ Basic structures
 '''
 
 from struct import Struct
+from functools import lru_cache
+from collections.abc import Sequence
 
-from .helpers import num, hexbyte
+from .helpers import num, hexbyte, require_numpy
 from .enums import GradientType
+from .errors import VersionError
 
 _MAGIC = b'4-tP'
 _LENGTH = Struct('<i')
@@ -13,25 +16,41 @@ _LENGTH = Struct('<i')
 
 def _bare(fmt: str, mul=None) -> tuple:
     fmt = Struct(fmt)
+    pack = fmt.pack
+    unpack = fmt.unpack_from
+    count = len(unpack(bytes(fmt.size)))
 
-    def packer(*data) -> bytes:
-        if mul is not None:
-            data = [x / mul for x in data]
-        return fmt.pack(*data)
-
-    def unpacker(data: bytes):
-        result = fmt.unpack(data)
-        if mul is not None:
-            result = [x * mul for x in result]
-        if len(result) == 1:
-            result = result[0]
-        return result
+    if mul is None:
+        packer = pack
+    else:
+        def packer(*data) -> bytes:
+            return pack(*[x / mul for x in data])
+
+    # Unpackers read from data[start:end] without slicing it,
+    # and are specialised to avoid per-value work where possible.
+    if count == 1 and mul is None:
+        def unpacker(data, start=0, end=None):
+            return unpack(data, start)[0]
+    elif count == 1:
+        def unpacker(data, start=0, end=None):
+            return unpack(data, start)[0] * mul
+    elif mul is None:
+        def unpacker(data, start=0, end=None):
+            return unpack(data, start)
+    elif count == 2:
+        def unpacker(data, start=0, end=None):
+            x, y = unpack(data, start)
+            return x * mul, y * mul
+    else:
+        def unpacker(data, start=0, end=None):
+            return tuple([x * mul for x in unpack(data, start)])
     return packer, unpacker
 
 
-def string_unpack(data: bytes) -> str:
-    length, = _LENGTH.unpack(data[:4])
-    return data[4:4+length].decode().replace('\x00', '')
+def string_unpack(data: bytes, start=0, end=None) -> str:
+    length, = _LENGTH.unpack_from(data, start)
+    start += 4
+    return data[start:start+length].decode().replace('\x00', '')
 
 
 def string_pack(data: str) -> bytes:
@@ -40,42 +59,70 @@ def string_pack(data: str) -> bytes:
     return _LENGTH.pack(len(data)) + data + b'\x00' * buffer_bytes
 
 
-def array_unpack(data: bytes) -> list:
-    length, = _LENGTH.unpack(data[4:8])
-    data = data[8:]
-    starts = data[:4*length]
-    data = data[4*length:]
+class BlobArray(Sequence):
+    '''
+    The blobs held in an `Arry` blob, as a read-only sequence of bytes.
 
-    blobs = []
-    for i in range(length):
-        i *= 4
-        start, = _LENGTH.unpack(starts[i:i+4])
-        end = starts[i+4:i+8]
-        if end:
-            end, = _LENGTH.unpack(end)
-        else:
-            end = None
-        blob = data[start:end]
-        blobs.append(blob)
-    return blobs
+    This is a view on the original data: the offset table is read once,
+    and each blob is only copied out when accessed.
+    '''
+    __slots__ = ('_data', '_starts', '_ends')
 
+    def __init__(self, data):
+        data = memoryview(data)
+        length, = _LENGTH.unpack_from(data, 4)
+        starts = Struct(f'<{length}i').unpack_from(data, 8)
+        self._data = data[8 + 4*length:]
+        self._starts = starts
+        self._ends = starts[1:] + (len(self._data), )
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._data[self._starts[i]:self._ends[i]].tobytes()
+
+    def __iter__(self):
+        data = self._data
+        for start, end in zip(self._starts, self._ends):
+            yield data[start:end].tobytes()
 
-def array_pack(blobs: list) -> bytes:
-    pos = 0
-    starts = []
-    for blob in blobs:
-        starts.append(pos)
-        pos += len(blob)
+    def __eq__(self, other):
+        if isinstance(other, (BlobArray, list, tuple)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f'BlobArray({list(self)!r})'
+
+
+def array_unpack(data: bytes, start=0, end=None) -> BlobArray:
+    return BlobArray(memoryview(data)[start:end])
+
+
+def array_pack(blobs) -> bytes:
+    if isinstance(blobs, BlobArray):
+        starts, blobs = blobs._starts, [blobs._data]
+    else:
+        starts = []
+        pos = 0
+        for blob in blobs:
+            starts.append(pos)
+            pos += len(blob)
 
-    return (
-        _LENGTH.pack(1) + _LENGTH.pack(len(blobs)) +
-        b''.join([_LENGTH.pack(i) for i in starts]) +
-        b''.join(blobs)
-    )
+    length = len(starts)
+    return b''.join([
+        _LENGTH.pack(1), _LENGTH.pack(length),
+        Struct(f'<{length}i').pack(*starts),
+        *blobs
+    ])
 
 
-def kind_unpack(data: bytes) -> str:
-    return data[::-1].decode()
+def kind_unpack(data: bytes, start=0, end=None) -> str:
+    return data[start:end][::-1].decode()
 
 
 def kind_pack(data: str) -> bytes:
@@ -97,32 +144,172 @@ _FORMATS = {
 }
 
 
-def blob(blob: bytes) -> object:
+# Decoding dispatches on the raw 8-byte header (magic and reversed kind),
+# so that known blobs need no validation beyond a dictionary lookup.
+_HEADERS = {kind: _MAGIC + kind[::-1] for kind in _FORMATS}
+_DECODERS = {_HEADERS[kind]: unpack for kind, (pack, unpack) in _FORMATS.items()}
+
+# Blobs whose decoded values are mutable or large are never memoized.
+_UNMEMOIZED = {_HEADERS[b'Arry']}
+
+
+def _invalid(blob: bytes):
     if not len(blob) > 12:
-        raise TypeError('Pixelmator blobs are more than 12 bytes! ')
+        return TypeError('Pixelmator blobs are more than 12 bytes! ')
+    if not blob[:4] == _MAGIC:
+        return TypeError(
+            'Pixelmator blobs start with the magic number "4-tP".')
+    return TypeError(f'Unknown blob type {bytes(blob[4:8][::-1])}.')
+
+
+def _decode(blob: bytes) -> object:
+    unpacker = _DECODERS.get(blob[:8])
+    if unpacker is None or len(blob) <= 12:
+        raise _invalid(blob)
+    length, = _LENGTH.unpack_from(blob, 8)
+    return unpacker(blob, 12, 12 + length)
+
+
+_memo = None
 
-    magic = blob[:4]
-    if not magic == _MAGIC:
-        raise TypeError('Pixelmator blobs start with the magic number "4-tP".')
 
-    kind = blob[4:8][::-1]
-    if kind in _FORMATS:
-        packer, unpacker = _FORMATS[kind]
+def memoize_blobs(maxsize=4096):
+    '''
+    Set how many decoded blobs are remembered, to save decoding
+    the many identical blobs (opacity, flags...) found in documents.
+
+    Only blobs whose values are immutable are remembered.
+    Give `maxsize=0` to turn this off.
+    '''
+    global _memo
+    if maxsize:
+        _memo = lru_cache(maxsize)(_decode)
     else:
-        raise TypeError(f'Unknown blob type {kind}.')
+        _memo = None
 
-    length, = _LENGTH.unpack(blob[8:12])
-    data = blob[12:12+length]
-    return unpacker(data)
+
+memoize_blobs()
+
+
+def blob(blob: bytes) -> object:
+    if (
+        _memo is not None
+        and type(blob) is bytes
+        and blob[:8] not in _UNMEMOIZED
+    ):
+        return _memo(blob)
+    return _decode(blob)
 
 
 def make_blob(kind: bytes, *data) -> bytes:
     if kind not in _FORMATS:
         raise TypeError(f'Unknown blob type {kind}.')
-    packer, unpacker = _FORMATS[kind]
-    data = packer(*data)
-    length = _LENGTH.pack(len(data))
-    return _MAGIC + kind[::-1] + length + data
+    data = _FORMATS[kind][0](*data)
+    return _HEADERS[kind] + _LENGTH.pack(len(data)) + data
+
+
+# Fixed-size blobs which can be decoded as columns:
+# kind -> (data dtype, values per blob, multiplier)
+_COLUMNS = {
+    b'PTPt': ('>f8', 2, 2),
+    b'PTSz': ('>f8', 2, 2),
+    b'PTFl': ('>f8', 1, None),
+    b'LOpc': ('<u2', 1, None),
+    b'UI64': ('<u8', 1, None),
+}
+
+
+def _column_dtype(np, kind):
+    fmt, count, mul = _COLUMNS[kind]
+    shape = (count, ) if count > 1 else ()
+    return np.dtype([
+        ('head', '<u8'), ('length', '<i4'), ('data', fmt, shape)
+    ])
+
+
+def decode_blobs(kind: bytes, blobs):
+    '''
+    Decode a sequence of blobs of the same kind into a NumPy array,
+    with one row per blob.
+
+    Supports `PTPt`, `PTSz` (giving N by 2 arrays), `PTFl`,
+    `LOpc` and `UI64` (giving arrays of length N).
+    '''
+    np = require_numpy()
+    if kind not in _COLUMNS:
+        raise TypeError(f'Cannot decode {kind} blobs as an array.')
+    fmt, count, mul = _COLUMNS[kind]
+    dtype = _column_dtype(np, kind)
+
+    blobs = list(blobs)
+    raw = b''.join(blobs)
+    if len(raw) != len(blobs) * dtype.itemsize:
+        # padded or otherwise unusual blobs; take the slow road
+        return np.array([blob(b) for b in blobs], dtype=fmt[1:])
+
+    rows = np.frombuffer(raw, dtype)
+    header = int.from_bytes(_HEADERS[kind], 'little')
+    if (rows['head'] != header).any():
+        raise TypeError(f'Not all blobs are of type {kind}.')
+
+    data = rows['data'].astype(fmt[1:])
+    if mul is not None:
+        data *= mul
+    return data
+
+
+def encode_blobs(kind: bytes, array) -> list:
+    '''
+    Encode a NumPy array (or anything array-like) into a list of
+    blobs of the given kind, one per row. The inverse of `decode_blobs`.
+    '''
+    np = require_numpy()
+    if kind not in _COLUMNS:
+        raise TypeError(f'Cannot encode {kind} blobs from an array.')
+    fmt, count, mul = _COLUMNS[kind]
+    dtype = _column_dtype(np, kind)
+
+    array = np.asarray(array)
+    if mul is not None:
+        array = array / mul
+    rows = np.empty(len(array), dtype)
+    rows['head'] = int.from_bytes(_HEADERS[kind], 'little')
+    rows['length'] = dtype['data'].itemsize
+    rows['data'] = array
+
+    raw = rows.tobytes()
+    size = dtype.itemsize
+    return [raw[i:i+size] for i in range(0, len(raw), size)]
+
+
+def decode_points(blobs):
+    '''Decode `PTPt` blobs, eg positions, into an N by 2 NumPy array.'''
+    return decode_blobs(b'PTPt', blobs)
+
+
+def decode_sizes(blobs):
+    '''Decode `PTSz` blobs, eg sizes, into an N by 2 NumPy array.'''
+    return decode_blobs(b'PTSz', blobs)
+
+
+def decode_floats(blobs):
+    '''Decode `PTFl` blobs, eg angles, into a NumPy array of length N.'''
+    return decode_blobs(b'PTFl', blobs)
+
+
+def encode_points(array) -> list:
+    '''Encode an N by 2 array into `PTPt` blobs.'''
+    return encode_blobs(b'PTPt', array)
+
+
+def encode_sizes(array) -> list:
+    '''Encode an N by 2 array into `PTSz` blobs.'''
+    return encode_blobs(b'PTSz', array)
+
+
+def encode_floats(array) -> list:
+    '''Encode an array of length N into `PTFl` blobs.'''
+    return encode_blobs(b'PTFl', array)
 
 
 def verb(data, version=1):
@@ -278,8 +465,72 @@ class Gradient:
         data = {'csr': 0}
         data['m'] = list(self.midpoints)
         data['s'] = [
-            [1, [[c.r/255, c.g/255, c.g/255, c.a/255], x]]
+            [1, [[c.r/255, c.g/255, c.b/255, c.a/255], x]]
             for c, x in self.colors
         ]
         data['t'] = int(self.kind)
         return [1, data]
+
+    def lut(self, n=256):
+        '''
+        The gradient sampled at `n` evenly spaced points from 0 to 1,
+        as a read-only (n, 4) NumPy array of RGBA from 0 to 1.
+
+        Each midpoint is where its neighbouring colours mix half and half.
+        Tables are remembered, so asking again is free until the
+        gradient changes.
+        '''
+        stops = tuple((tuple(c), x) for c, x in self.colors)
+        return _gradient_lut(stops, tuple(self.midpoints), n)
+
+    def render(self, shape, start, end, n=256):
+        '''
+        Render the gradient to a (height, width, 4) NumPy array
+        of RGBA from 0 to 1.
+
+        The gradient runs from `start` to `end`, given as (x, y)
+        pixels from the top-left, and is linear, radial (around `start`)
+        or angled (around `start`, starting towards `end`) according to
+        its `kind`. Pixels are looked up in `lut(n)`.
+        '''
+        np = require_numpy()
+        h, w = shape
+        x0, y0 = start
+        dx, dy = end[0] - x0, end[1] - y0
+        x = np.arange(w, dtype=np.float32) + (0.5 - x0)
+        y = np.arange(h, dtype=np.float32)[:, None] + (0.5 - y0)
+
+        if self.kind == GradientType.linear:
+            length = dx * dx + dy * dy or 1
+            t = (x * dx + y * dy) / length
+        elif self.kind == GradientType.radial:
+            t = np.hypot(x, y) / (np.hypot(dx, dy) or 1)
+        else:
+            t = (np.arctan2(y, x) - np.arctan2(dy, dx)) / (2 * np.pi) % 1
+
+        index = np.clip(t * (n - 1) + 0.5, 0, n - 1).astype(np.intp)
+        return self.lut(n)[index]
+
+
+@lru_cache(maxsize=256)
+def _gradient_lut(stops, midpoints, n):
+    np = require_numpy()
+    colors = np.array([c for c, x in stops], np.float32) / 255
+    xs = np.array([x for c, x in stops], np.float32)
+    t = np.linspace(0, 1, n, dtype=np.float32)
+    if len(stops) == 1:
+        lut = np.repeat(colors, n, axis=0)
+        lut.flags.writeable = False
+        return lut
+
+    i = np.clip(np.searchsorted(xs, t, side='right') - 1, 0, len(xs) - 2)
+    x1, x2 = xs[i], xs[i + 1]
+    u = np.clip((t - x1) / (x2 - x1), 0, 1)
+    # bend each segment so that its midpoint is at u = 1/2
+    mid = (np.array(midpoints, np.float32) - xs[:-1]) / (xs[1:] - xs[:-1])
+    mid = np.clip(mid, 1e-3, 1 - 1e-3)
+    u **= (np.log(0.5) / np.log(mid))[i]
+
+    lut = colors[i] + (colors[i + 1] - colors[i]) * u[:, None]
+    lut.flags.writeable = False
+    return lut
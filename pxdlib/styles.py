@@ -1,4 +1,5 @@
 from math import pi
+from collections import ChainMap
 
 from .helpers import dicts, uuid
 from .structure import RGBA, Gradient
@@ -57,17 +58,19 @@ class Style:
     @classmethod
     def _from_layer(cls, data):
         '''Internal binding'''
-        self = cls()
-        self._dict.update(data)
-        if 'gSP' in self._dict:
-            self._dict['_gPos'] = (
-                self._dict.pop('gSP'), self._dict.pop('gEP')
-            )
+        # The layer's data is shared, so is read through rather than
+        # copied; any changes are made in front of it.
+        self = cls.__new__(cls)
+        self._dict = ChainMap({}, data, cls._defaults)
+        if 'id' not in data:
+            self._dict['id'] = uuid()
+        if 'gSP' in data:
+            self._dict['_gPos'] = (data['gSP'], data['gEP'])
         return self
 
     def _to_layer(self):
         '''Internal binding'''
-        data = self._dict
+        data = dict(self._dict)
         if '_gPos' in data:
             data['gSP'], data['gEP'] = data.pop('_gPos')
         return data
@@ -0,0 +1,221 @@
+'''
+Vector layer paths, held in `shape-shapeData`.
+
+Pixelmator's path encoding is not yet reverse-engineered, so shapes
+are read in the following layout:
+
+- `shape-shapeData` is a JSON vercon, holding `pathCodableWrappers`;
+- `pathCodableWrappers` is a vercon of a list of path vercons,
+  each holding `dataFromCGPath` (as `text-pathData` does);
+- `dataFromCGPath` is base 64 of a sequence of path elements, each
+  a little-endian int32 `PathVerb` followed by as many points as it
+  takes (see `_POINTS`), each two little-endian float64s.
+
+Shapes in any other layout raise a `VectorError`.
+'''
+
+import base64
+import binascii
+from collections import namedtuple
+from struct import Struct, error as StructError
+
+from .enums import PathVerb
+from .errors import VectorError
+from .helpers import json_loads, json_dumps, require_numpy
+from .structure import verb
+
+# the number of points each PathVerb takes
+_POINTS = (1, 1, 2, 3, 0)
+_VERB = Struct('<i')
+
+
+class Path:
+    '''
+    A vector path, as contiguous NumPy arrays:
+
+    - `points`, an (n, 2) float64 array of every point;
+    - `verbs`, a uint8 array of the `PathVerb` of each element;
+    - `subpaths`, the index in `verbs` of the start of each subpath,
+      followed by `len(verbs)`.
+
+    Paths are not modified in place; see `transformed`.
+    '''
+    __slots__ = ('points', 'verbs', 'subpaths')
+
+    def __init__(self, points, verbs, subpaths=None):
+        np = require_numpy()
+        verbs = np.array(verbs, np.uint8)
+        points = np.array(points, np.float64).reshape(-1, 2)
+        if (verbs > PathVerb.close).any():
+            raise ValueError('Unknown path verb.')
+        if np.take(_POINTS, verbs).sum() != len(points):
+            raise ValueError('Number of points does not match the verbs.')
+        if subpaths is None:
+            subpaths = np.flatnonzero(verbs == PathVerb.moveTo)
+            subpaths = np.append(subpaths, len(verbs))
+        subpaths = np.array(subpaths, np.intp)
+        for array in (points, verbs, subpaths):
+            array.flags.writeable = False
+        self.points, self.verbs, self.subpaths = points, verbs, subpaths
+
+    def __repr__(self):
+        return (
+            f'<Path: {len(self.subpaths) - 1} subpaths,'
+            f' {len(self.verbs)} elements, {len(self.points)} points>'
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, Path):
+            return NotImplemented
+        return (
+            self.verbs.tobytes() == other.verbs.tobytes()
+            and self.points.tobytes() == other.points.tobytes()
+        )
+
+    def bounds(self):
+        '''
+        The bounding box of the path's points, as (x0, y0, x1, y1),
+        or None if it has none. This contains any curves.
+        '''
+        if not len(self.points):
+            return None
+        (x0, y0), (x1, y1) = self.points.min(axis=0), self.points.max(axis=0)
+        return float(x0), float(y0), float(x1), float(y1)
+
+    def transformed(self, scale=(1, 1), translate=(0, 0)):
+        '''
+        A copy of the path, scaled (about the origin) then translated.
+        '''
+        np = require_numpy()
+        points = self.points * np.asarray(scale, np.float64)
+        points += np.asarray(translate, np.float64)
+        return Path(points, self.verbs, self.subpaths)
+
+
+def bounds(paths):
+    '''
+    The bounding boxes of many paths at once, as an (n, 4) NumPy array
+    of (x0, y0, x1, y1), with NaN for paths without points.
+    '''
+    np = require_numpy()
+    paths = list(paths)
+    out = np.full((len(paths), 4), np.nan)
+    counts = np.array([len(p.points) for p in paths], np.intp)
+    full = np.flatnonzero(counts)
+    if not full.size:
+        return out
+    points = np.concatenate([paths[i].points for i in full])
+    starts = np.concatenate([[0], np.cumsum(counts[full])[:-1]])
+    out[full, :2] = np.minimum.reduceat(points, starts)
+    out[full, 2:] = np.maximum.reduceat(points, starts)
+    return out
+
+
+def _point_offsets(np, starts, counts):
+    # the offset of every byte of every point, given the offset of
+    # each element's points and how many it has
+    before = np.cumsum(counts) - counts
+    offsets = np.repeat(starts, counts)
+    offsets += 16 * (np.arange(len(offsets)) - np.repeat(before, counts))
+    return offsets[:, None] + np.arange(16)
+
+
+def _decode_path(np, data):
+    # Elements vary in length, so are walked to find where each is,
+    # then every point is gathered in one go.
+    verbs, starts = [], []
+    pos, end = 0, len(data)
+    try:
+        while pos < end:
+            v, = _VERB.unpack_from(data, pos)
+            if not 0 <= v <= PathVerb.close:
+                raise VectorError(f'Unknown path element {v}.')
+            verbs.append(v)
+            starts.append(pos + 4)
+            pos += 4 + 16 * _POINTS[v]
+    except StructError:
+        raise VectorError('Path data is truncated.') from None
+    if pos != end:
+        raise VectorError('Path data is truncated.')
+
+    counts = np.take(_POINTS, verbs).astype(np.intp)
+    offsets = _point_offsets(np, np.array(starts, np.intp), counts)
+    points = np.frombuffer(data, np.uint8)[offsets].view('<f8')
+    return verbs, points.reshape(-1, 2)
+
+
+def _encode_path(np, verbs, points):
+    counts = np.take(_POINTS, verbs).astype(np.intp)
+    size = 4 * len(verbs) + 16 * len(points)
+    out = np.zeros(size, np.uint8)
+    starts = 4 * np.arange(len(verbs)) + 16 * (np.cumsum(counts) - counts)
+    out[starts[:, None] + np.arange(4)] = (
+        np.asarray(verbs, '<i4').view(np.uint8).reshape(-1, 4))
+    out[_point_offsets(np, starts + 4, counts)] = (
+        np.ascontiguousarray(points, '<f8').view(np.uint8).reshape(-1, 16))
+    return out.tobytes()
+
+
+def _rewrap(original, content):
+    # put new content in a vercon, verstruct or verlist like the original
+    if isinstance(original, dict):
+        if 'version' in original:
+            return dict(original, versionSpecifiContainer=content)
+        return dict(original, versionSpecificInfo=content)
+    return [original[0], content]
+
+
+Shape = namedtuple('Shape', ('data', 'parts', 'path'))
+
+
+def parse_shape(data) -> Shape:
+    '''
+    Decode `shape-shapeData`, giving the decoded JSON, the index in
+    `path.verbs` at which each of its paths starts, and every path
+    joined as a single `Path`.
+    '''
+    np = require_numpy()
+    try:
+        data = json_loads(data)
+        wrappers = verb(verb(data)['pathCodableWrappers'])
+        decoded = [
+            _decode_path(np, base64.b64decode(verb(w)['dataFromCGPath']))
+            for w in wrappers
+        ]
+    except (KeyError, TypeError, ValueError, binascii.Error) as e:
+        raise VectorError(f'Unexpected shape data ({e!r}).') from e
+
+    verbs = [v for vs, _ in decoded for v in vs]
+    parts = np.cumsum([0] + [len(vs) for vs, _ in decoded])
+    points = np.concatenate([p for _, p in decoded] or [np.empty((0, 2))])
+    return Shape(data, parts, Path(points, verbs))
+
+
+def encode_shape(shape: Shape, path: Path) -> bytes:
+    '''
+    Encode `shape-shapeData` with a new path, which must be made of
+    the same elements as the shape's own (as it is when transformed).
+    '''
+    np = require_numpy()
+    if path.verbs.tobytes() != shape.path.verbs.tobytes():
+        raise VectorError('Paths can only be given new points.')
+
+    data = shape.data
+    container = verb(data)
+    wrappers = verb(container['pathCodableWrappers'])
+    counts = np.take(_POINTS, path.verbs).astype(np.intp)
+    ends = np.concatenate([[0], np.cumsum(counts)])
+
+    new = []
+    for wrapper, start, end in zip(wrappers, shape.parts, shape.parts[1:]):
+        encoded = _encode_path(
+            np, path.verbs[start:end], path.points[ends[start]:ends[end]])
+        content = dict(
+            verb(wrapper),
+            dataFromCGPath=base64.b64encode(encoded).decode())
+        new.append(_rewrap(wrapper, content))
+
+    container = dict(
+        container,
+        pathCodableWrappers=_rewrap(container['pathCodableWrappers'], new))
+    return json_dumps(_rewrap(data, container))
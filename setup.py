@@ -23,6 +23,10 @@ setuptools.setup(
         "Topic :: Multimedia :: Graphics :: Editors",
     ],
     keywords="Pixelmator pxd file image raster vector",
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=[],
+    extras_require={
+        'numpy': ['numpy'],
+        'fast': ['orjson'],
+    },
 )
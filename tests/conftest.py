@@ -0,0 +1,16 @@
+import pytest
+
+from pxdlib import PXDFile
+
+from benchmarks._document import make_document
+
+
+@pytest.fixture
+def new_pxd(tmp_path):
+    '''Make an empty document, with a given name.'''
+    return lambda name='test.pxd': PXDFile(make_document(tmp_path, name))
+
+
+@pytest.fixture
+def pxd(new_pxd):
+    return new_pxd()
@@ -0,0 +1,34 @@
+import pytest
+
+from pxdlib import RasterLayer
+
+np = pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def layer(pxd):
+    with pxd:
+        layer = RasterLayer(pxd)
+        layer.opacity = 50
+        layer.angle = 10
+    return layer
+
+
+@pytest.mark.parametrize('opacity', [300, -1])
+def test_commit_rejects_invalid_opacity(pxd, layer, opacity):
+    frame = pxd.frame()
+    frame.opacity[:] = opacity
+    with pxd, pytest.raises(TypeError):
+        frame.commit()
+    assert layer.opacity == 50
+
+
+def test_commit_normalises_angle(pxd, layer):
+    frame = pxd.frame()
+    frame.angle[:] = 370
+    frame.opacity[:] = 20
+    with pxd:
+        frame.commit()
+    assert layer.angle == 10
+    assert layer.opacity == 20
+    assert frame.angle[0] == 10
@@ -0,0 +1,22 @@
+from pxdlib import GroupLayer, RasterLayer
+
+
+def test_new_layer_on_fresh_document(pxd):
+    with pxd:
+        layer = RasterLayer(pxd)
+        assert pxd.children == [layer]
+        assert pxd.all_layers() == [layer]
+        layer.delete()
+        assert pxd.children == []
+
+
+def test_copy_to_fresh_document(pxd, new_pxd):
+    with pxd:
+        group = GroupLayer(pxd)
+        RasterLayer(group)
+
+    other = new_pxd('other.pxd')
+    with other:
+        copy = group.copyto(other)
+        assert other.children == [copy]
+        assert len(other.all_layers()) == 2
@@ -0,0 +1,17 @@
+import pytest
+
+from pxdlib import RasterLayer, RasterError
+
+np = pytest.importorskip('numpy')
+
+
+def test_from_array_needs_pxdlib_only(pxd):
+    pixels = np.full((4, 4, 4), 255, np.uint8)
+    with pxd:
+        with pytest.raises(RasterError):
+            RasterLayer.from_array(pxd, pixels)
+        assert pxd.children == []
+
+        layer = RasterLayer.from_array(pxd, pixels, pxdlib_only=True)
+        assert pxd.children == [layer]
+        assert (layer.to_array() == pixels).all()